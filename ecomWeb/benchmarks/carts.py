@@ -0,0 +1,147 @@
+"""Concurrent cart update check and benchmark.
+
+--threads threads each click --clicks times on the same customer's cart
+line, against a temporary SQLite file, through project3.carts:
+
+- add_item: the line must end at threads * clicks, in a single row;
+- change_quantity -1 from a small start: the line must stop at 1;
+- change_quantity with half the threads adding and half removing: the line
+  must end where it started;
+- apply_deltas batches of +1: the line must grow by the sum of all deltas.
+
+Also runs the read-modify-write the views did before, for comparison (its
+lost updates are reported, not asserted). Exits non-zero on any lost or
+extra update and prints clicks per second for each case.
+
+    cd ecomWeb
+    python -m benchmarks.carts --threads 8 --clicks 200
+"""
+from threading import Thread, Barrier
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clicks', type=int, default=200, help='clicks per thread')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    return parser.parse_args()
+
+
+def build_app(args):
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'carts.sqlite')
+    os.environ.update(SQLALCHEMY_DATABASE_URI=database_url, SECRET_KEY='benchmark')
+    from project3.init import create_app, db
+    from project3.models import Customer, Product
+
+    app = create_app()
+    with app.app_context():
+        db.session.add(Customer(username='clicker', email='clicker@example.com', password='x'))
+        db.session.add(Product(product_name='Product', current_price_cents=1000, previous_price_cents=1000,
+                               in_stock=10 ** 6))
+        db.session.commit()
+    return app
+
+
+def hammer(app, args, click):
+    # Runs click(thread number) clicks times on every thread at once; returns clicks/s
+    barrier = Barrier(args.threads)
+    errors = []
+
+    def worker(number):
+        with app.app_context():
+            barrier.wait()
+            for _ in range(args.clicks):
+                try:
+                    click(number)
+                except Exception as e:
+                    errors.append(e)
+                    from project3.init import db
+                    db.session.rollback()
+
+    threads = [Thread(target=worker, args=(n,)) for n in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if errors:
+        print(f'  {len(errors)} clicks failed, e.g. {errors[0]!r}')
+    return args.threads * args.clicks / elapsed
+
+
+def main():
+    args = parse_args()
+    app = build_app(args)
+    from project3.init import db
+    from project3.models import Cart
+    from project3.carts import add_item, change_quantity, apply_deltas
+
+    def line():
+        db.session.expire_all()
+        rows = Cart.query.filter_by(customer_link=1, product_link=1).all()
+        return len(rows), rows[0].quantity if rows else None
+
+    def reset(quantity):
+        db.session.query(Cart).update({'quantity': quantity})
+        db.session.commit()
+
+    def legacy_plus(number):
+        # What plus_cart did before: read, add in Python, write back
+        item = Cart.query.filter_by(customer_link=1, product_link=1).first()
+        item.quantity = item.quantity + 1
+        db.session.commit()
+
+    total = args.threads * args.clicks
+    failures = []
+    print(f'{args.threads} threads x {args.clicks} clicks')
+    with app.app_context():
+        rate = hammer(app, args, lambda n: add_item(1, 1))
+        rows, quantity = line()
+        cart_id = Cart.query.filter_by(customer_link=1, product_link=1).one().id
+        print(f'add_item:               {rate:>8.0f} clicks/s, {rows} row(s), quantity {quantity} (expected {total})')
+        if (rows, quantity) != (1, total):
+            failures.append('add_item')
+
+        reset(5)
+        rate = hammer(app, args, lambda n: change_quantity(1, cart_id, -1))
+        quantity = line()[1]
+        print(f'change_quantity -1:     {rate:>8.0f} clicks/s, quantity {quantity} (expected the clamp at 1)')
+        if quantity != 1:
+            failures.append('change_quantity clamp')
+
+        start_quantity = total + 1
+        reset(start_quantity)
+        rate = hammer(app, args, lambda n: change_quantity(1, cart_id, 1 if n % 2 else -1))
+        quantity = line()[1]
+        expected = start_quantity + sum(args.clicks if n % 2 else -args.clicks for n in range(args.threads))
+        print(f'change_quantity +/-1:   {rate:>8.0f} clicks/s, quantity {quantity} (expected {expected})')
+        if quantity != expected:
+            failures.append('change_quantity +/-')
+
+        reset(1)
+        rate = hammer(app, args, lambda n: apply_deltas(1, {cart_id: 2}))
+        quantity = line()[1]
+        print(f'apply_deltas +2:        {rate:>8.0f} batches/s, quantity {quantity} (expected {1 + 2 * total})')
+        if quantity != 1 + 2 * total:
+            failures.append('apply_deltas')
+
+        reset(0)
+        rate = hammer(app, args, legacy_plus)
+        quantity = line()[1]
+        print(f'read-modify-write:      {rate:>8.0f} clicks/s, quantity {quantity} ({total - quantity} lost updates)')
+
+    if failures:
+        sys.exit(f'lost or extra updates: {", ".join(failures)}')
+    print('ok: no lost updates')
+
+
+if __name__ == '__main__':
+    main()
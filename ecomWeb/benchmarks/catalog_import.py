@@ -0,0 +1,98 @@
+"""Bulk catalog import benchmark.
+
+Writes a --rows product CSV to a temporary directory and imports it into a
+fresh SQLite database with project3.imports.import_products, printing the
+per-chunk progress and the final rows per second. Then imports --baseline
+rows the way the add-shop-items form does, one Product add and commit per
+row, for comparison. --pictures N makes N distinct local pictures referenced
+by the rows, to include the parallel resize in the timing.
+
+    cd ecomWeb
+    python -m benchmarks.catalog_import --rows 50000 --pictures 200
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--baseline', type=int, default=1000, help='rows imported one commit at a time')
+    parser.add_argument('--pictures', type=int, default=0, help='distinct local pictures (needs Pillow)')
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def write_csv(path, args):
+    rng = random.Random(args.seed)
+    pictures = []
+    if args.pictures:
+        from PIL import Image
+        for n in range(args.pictures):
+            name = f'picture-{n}.png'
+            Image.new('RGB', (1600, 1200), (rng.randrange(256), rng.randrange(256), n % 256)) \
+                .save(os.path.join(os.path.dirname(path), name))
+            pictures.append(name)
+
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['product_name', 'description', 'current_price', 'previous_price', 'in_stock',
+                         'flash_sale', 'product_picture'])
+        for n in range(args.rows):
+            price = rng.randint(100, 99999)
+            writer.writerow([f'Product {n}', f'Bulk imported product number {n}', f'{price / 100:.2f}',
+                             f'{price * 1.2 / 100:.2f}', rng.randint(0, 500), rng.random() < 0.05,
+                             pictures[n % len(pictures)] if pictures else ''])
+
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp()
+    os.environ.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(workdir, 'import.sqlite'),
+                      SECRET_KEY='benchmark')
+    from project3.init import create_app, db
+    from project3.models import Product
+    from project3.imports import import_products, progress_line
+    from project3.money import to_cents
+
+    app = create_app()
+    if args.pictures:
+        from project3.images import images
+        images.media_dir = os.path.join(workdir, 'media')  # keep benchmark pictures out of static/
+        os.makedirs(images.media_dir)
+
+    path = os.path.join(workdir, 'products.csv')
+    write_csv(path, args)
+
+    with app.app_context():
+        with open(path, newline='') as stream:
+            for stats in import_products(stream, 'csv', workdir, args.chunk_size):
+                print(progress_line(stats))
+        print(f"bulk import: {stats['rows']} rows in {stats['seconds']} s, {stats['rows_per_second']} rows/s")
+
+        with open(path, newline='') as stream:
+            rows = list(csv.DictReader(stream))[:args.baseline]
+        start = time.perf_counter()
+        for row in rows:
+            product = Product()
+            product.product_name = row['product_name']
+            product.description = row['description']
+            product.current_price_cents = to_cents(row['current_price'])
+            product.previous_price_cents = to_cents(row['previous_price'])
+            product.in_stock = int(row['in_stock'])
+            db.session.add(product)
+            db.session.commit()
+        elapsed = time.perf_counter() - start
+        print(f'one commit per row: {len(rows)} rows in {elapsed:.3f} s, {len(rows) / elapsed:.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Checkout finalization benchmark.
+
+For carts of --sizes lines, refills a customer's cart (untimed) and times
+turning it into orders --repeat times, in a temporary SQLite file:
+
+- "per row": what payment_success did before project3.checkout, one ORM
+  Order per cart line through the unit of work, then loading and deleting
+  each cart line;
+- "bulk": project3.checkout.finalize_order, which also decrements stock and
+  writes the order header and report rows.
+
+Prints the mean milliseconds and SQL statements per checkout.
+
+    cd ecomWeb
+    python -m benchmarks.checkout --sizes 1 10 100 500 --repeat 20
+"""
+from sqlalchemy import event, insert
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 500])
+    parser.add_argument('--repeat', type=int, default=20)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    os.environ.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'checkout.sqlite'),
+                      SECRET_KEY='benchmark')
+    from project3.init import create_app, db
+    from project3.models import Customer, Product, Cart, Order
+    from project3.checkout import finalize_order
+
+    app = create_app()
+    statements = [0]
+
+    def legacy_finalize(customer_id, payment_id):
+        items = Cart.query.filter_by(customer_link=customer_id).all()
+        for item in items:
+            db.session.add(Order(price_cents=item.product.current_price_cents * item.quantity,
+                                 payment_id=payment_id, quantity=item.quantity, status='Paid',
+                                 customer_link=customer_id, product_link=item.product.id))
+        for item in Cart.query.filter_by(customer_link=customer_id).all():
+            db.session.delete(item)
+        db.session.commit()
+
+    with app.app_context():
+        db.session.add(Customer(username='buyer', email='buyer@example.com', password='x'))
+        db.session.execute(insert(Product), [
+            {'product_name': f'Product {i}', 'current_price_cents': 1000 + i, 'previous_price_cents': 2000,
+             'in_stock': 10 ** 9} for i in range(max(args.sizes))])
+        db.session.commit()
+
+        @event.listens_for(db.engine, 'after_cursor_execute')
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements[0] += 1
+
+        print(f"{'lines':>6} {'per row ms':>11} {'stmts':>6} {'bulk ms':>9} {'stmts':>6} {'speedup':>8}")
+        payment = 0
+        for size in args.sizes:
+            results = {}
+            for name, finalize in (('per row', legacy_finalize), ('bulk', finalize_order)):
+                elapsed, executed = 0.0, 0
+                for _ in range(args.repeat):
+                    db.session.execute(insert(Cart), [
+                        {'customer_link': 1, 'product_link': i + 1, 'quantity': 2} for i in range(size)])
+                    db.session.commit()
+                    db.session.expunge_all()
+                    payment += 1
+                    before = statements[0]
+                    start = time.perf_counter()
+                    finalize(1, f'pi_bench_{payment}')
+                    elapsed += time.perf_counter() - start
+                    executed += statements[0] - before
+                results[name] = (elapsed / args.repeat * 1000, executed / args.repeat)
+            legacy, bulk = results['per row'], results['bulk']
+            print(f'{size:>6} {legacy[0]:>11.2f} {legacy[1]:>6.0f} {bulk[0]:>9.2f} {bulk[1]:>6.0f} '
+                  f'{legacy[0] / bulk[0]:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Hot-path index benchmark.
+
+Seeds large cart, order and product tables in a temporary SQLite file,
+without the indexes migration 2 adds, then with them. For each hot-path
+filter it prints SQLite's EXPLAIN QUERY PLAN and the mean latency:
+
+- a customer's cart, and one cart line (add to cart);
+- a customer's latest orders (the orders page);
+- the flash sale products (home page).
+
+    cd ecomWeb
+    python -m benchmarks.indexes --customers 20000 --products 50000 --carts 500000 --orders 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERIES = {
+    'cart of a customer': 'SELECT * FROM cart WHERE customer_link = :customer',
+    'one cart line': 'SELECT * FROM cart WHERE customer_link = :customer AND product_link = :product',
+    'latest orders': 'SELECT * FROM "order" WHERE customer_link = :customer ORDER BY id DESC LIMIT 50',
+    'flash sale': 'SELECT * FROM product WHERE flash_sale = 1',
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=20000)
+    parser.add_argument('--products', type=int, default=50000)
+    parser.add_argument('--carts', type=int, default=500000)
+    parser.add_argument('--orders', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=200, help='executions per query, random parameters')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def create_schema(path):
+    from sqlalchemy import create_engine
+    from project3.init import db
+    from project3.migrations import HOT_PATH_INDEXES
+    import project3.models  # registers the tables on db.metadata
+
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        db.metadata.create_all(conn)
+        for index in HOT_PATH_INDEXES:
+            index.drop(conn)
+    engine.dispose()
+
+
+def seed(conn, args):
+    rng = random.Random(args.seed)
+    conn.executemany('INSERT INTO customer (username, email, password, date_joined) VALUES (?, ?, ?, ?)',
+                     ((f'c{i}', f'c{i}@example.com', 'x', '2024-01-01') for i in range(args.customers)))
+    conn.executemany(
+        'INSERT INTO product (product_name, current_price_cents, previous_price_cents, currency, in_stock, '
+        'flash_sale, date_added) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        ((f'Product {i}', 1000, 2000, 'usd', 10, rng.random() < 0.01, '2024-01-01') for i in range(args.products)))
+    lines = {(rng.randint(1, args.customers), rng.randint(1, args.products)) for _ in range(args.carts)}
+    conn.executemany('INSERT INTO cart (customer_link, product_link, quantity) VALUES (?, ?, 1)', lines)
+    conn.executemany(
+        'INSERT INTO "order" (customer_link, product_link, price_cents, currency, quantity, status, payment_id) '
+        'VALUES (?, ?, 1000, \'usd\', 1, \'Pending\', ?)',
+        ((rng.randint(1, args.customers), rng.randint(1, args.products), f'pi_{i}') for i in range(args.orders)))
+    conn.commit()
+
+
+def measure(conn, args, label):
+    rng = random.Random(args.seed)
+    conn.execute('ANALYZE')
+    print(f'\n{label}')
+    for name, sql in QUERIES.items():
+        params = {'customer': 1, 'product': 1}
+        plan = '; '.join(row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            params = {'customer': rng.randint(1, args.customers), 'product': rng.randint(1, args.products)}
+            conn.execute(sql, params).fetchall()
+        ms = (time.perf_counter() - start) / args.repeat * 1000
+        print(f'  {name:20} {ms:>9.3f} ms  {plan}')
+
+
+def main():
+    args = parse_args()
+    path = os.path.join(tempfile.mkdtemp(), 'indexes.sqlite')
+    create_schema(path)
+
+    conn = sqlite3.connect(path)
+    start = time.perf_counter()
+    seed(conn, args)
+    print(f'seeded {args.carts} cart lines, {args.orders} orders, {args.products} products '
+          f'in {time.perf_counter() - start:.1f} s')
+    measure(conn, args, 'without migration 2 indexes')
+
+    from sqlalchemy import create_engine
+    from sqlalchemy.schema import CreateIndex
+    from project3.migrations import HOT_PATH_INDEXES
+    engine = create_engine('sqlite://')
+    for index in HOT_PATH_INDEXES:
+        conn.execute(str(CreateIndex(index).compile(engine)))
+    conn.commit()
+    measure(conn, args, 'with migration 2 indexes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Money representation check and benchmark.
+
+Draws random carts of random two-decimal prices. For each cart it compares
+the old float arithmetic and the integer cents now stored against an exact
+Decimal reference:
+
+- the cart total as a float sum and as an integer sum;
+- each Stripe unit_amount, as int(price * 100) and as the stored cents.
+
+Then it seeds random carts into a throwaway database through the models and
+asserts that pricing.cart_totals() and the orders (and order header) written
+by checkout.finalize_order() equal the Decimal reference, cent for cent.
+
+It also times SUM(price * quantity) over a large cart table in SQLite with
+REAL and with INTEGER columns.
+
+    cd ecomWeb
+    python -m benchmarks.money --carts 2000 --lines 200
+"""
+from decimal import Decimal
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--carts', type=int, default=2000)
+    parser.add_argument('--lines', type=int, default=200, help='maximum lines per cart')
+    parser.add_argument('--db-carts', type=int, default=200, help='carts checked out through the database')
+    parser.add_argument('--products', type=int, default=2000, help='products for the database check')
+    parser.add_argument('--rows', type=int, default=500000, help='cart rows for the SQL timing')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def random_price(rng):
+    return f'{rng.randint(0, 99999)}.{rng.randint(0, 99):02d}'
+
+
+def random_cart(rng, max_lines):
+    # (price as a two-decimal string, quantity)
+    return [(random_price(rng), rng.randint(1, 20)) for _ in range(rng.randint(1, max_lines))]
+
+
+def check_carts(args):
+    from project3.money import to_cents, format_cents
+
+    rng = random.Random(args.seed)
+    float_totals_wrong = unit_amounts_truncated = lines = 0
+    for _ in range(args.carts):
+        cart = random_cart(rng, args.lines)
+        exact = sum(Decimal(price) * quantity for price, quantity in cart)
+
+        float_total = round(sum(float(price) * quantity for price, quantity in cart), 2)
+        float_totals_wrong += Decimal(str(float_total)) != exact
+
+        cents_total = sum(to_cents(price) * quantity for price, quantity in cart)
+        assert Decimal(format_cents(cents_total)) == exact, (cart, cents_total, exact)
+
+        for price, quantity in cart:
+            lines += 1
+            unit_amounts_truncated += int(float(price) * 100) != to_cents(price)
+            assert to_cents(float(price)) == to_cents(price) == int(Decimal(price) * 100)
+
+    print(f'{args.carts} carts, {lines} lines')
+    print(f'  float totals off by a cent or more: {float_totals_wrong}')
+    print(f'  int(price * 100) unit amounts truncated: {unit_amounts_truncated}')
+    print('  integer cents: every total and unit amount exact')
+
+
+def check_database(args):
+    os.environ.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'money.sqlite'),
+                      SECRET_KEY='benchmark')
+    from sqlalchemy import insert, select, func
+    from project3.init import create_app, db
+    from project3.models import Customer, Product, Cart, Order, OrderHeader
+    from project3.money import to_cents
+    from project3.pricing import cart_totals, SHIPPING_FEE_CENTS
+    from project3.checkout import finalize_order
+
+    rng = random.Random(args.seed)
+    prices = [random_price(rng) for _ in range(args.products)]
+
+    app = create_app()
+    with app.app_context():
+        db.session.execute(insert(Customer), [
+            {'username': f'customer{i}', 'email': f'customer{i}@example.com', 'password': 'x'}
+            for i in range(args.db_carts)])
+        db.session.execute(insert(Product), [
+            {'product_name': f'Product {i}', 'current_price_cents': to_cents(price),
+             'previous_price_cents': to_cents(price), 'in_stock': 10 ** 6}
+            for i, price in enumerate(prices)])
+
+        carts = {}
+        for customer_id in range(1, args.db_carts + 1):
+            products = rng.sample(range(1, len(prices) + 1), rng.randint(1, min(args.lines, len(prices))))
+            carts[customer_id] = [(product_id, rng.randint(1, 20)) for product_id in products]
+            db.session.execute(insert(Cart), [{'customer_link': customer_id, 'product_link': product_id,
+                                               'quantity': quantity} for product_id, quantity in carts[customer_id]])
+        db.session.commit()
+
+        lines = 0
+        for customer_id, cart in carts.items():
+            exact = sum(Decimal(prices[product_id - 1]) * quantity for product_id, quantity in cart) * 100
+            totals = cart_totals(customer_id)
+            assert totals['amount_cents'] == exact, (customer_id, totals, exact)
+            assert totals['total_cents'] == exact + SHIPPING_FEE_CENTS
+
+            payment_id = f'pi_money_{customer_id}'
+            assert finalize_order(customer_id, payment_id) == len(cart)
+            ordered = dict(db.session.execute(select(Order.product_link, Order.price_cents)
+                                              .where(Order.payment_id == payment_id)).all())
+            for product_id, quantity in cart:
+                assert ordered[product_id] == Decimal(prices[product_id - 1]) * quantity * 100, (payment_id, product_id)
+            assert sum(ordered.values()) == exact
+            header = db.session.execute(select(OrderHeader.total_cents)
+                                        .where(OrderHeader.payment_id == payment_id)).scalar()
+            assert header == exact, (payment_id, header, exact)
+            lines += len(cart)
+
+        assert db.session.execute(select(func.count(Cart.id))).scalar() == 0
+
+    print(f'{args.db_carts} carts, {lines} lines through the database')
+    print('  cart_totals, order prices and order header totals: every one exact')
+
+
+def time_sql(args):
+    rng = random.Random(args.seed)
+    rows = [(rng.randint(1, 1000), rng.randint(0, 9999999), rng.randint(1, 20)) for _ in range(args.rows)]
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE cart_real (customer INTEGER, price REAL, quantity INTEGER)')
+    conn.execute('CREATE TABLE cart_int (customer INTEGER, price INTEGER, quantity INTEGER)')
+    conn.executemany('INSERT INTO cart_real VALUES (?, ?, ?)', [(c, p / 100, q) for c, p, q in rows])
+    conn.executemany('INSERT INTO cart_int VALUES (?, ?, ?)', rows)
+
+    for table in ('cart_real', 'cart_int'):
+        start = time.perf_counter()
+        for _ in range(5):
+            conn.execute(f'SELECT customer, SUM(price * quantity) FROM {table} GROUP BY customer').fetchall()
+        print(f'  SUM over {args.rows} rows, {table}: {(time.perf_counter() - start) / 5 * 1000:.1f} ms')
+
+
+def main():
+    args = parse_args()
+    check_carts(args)
+    check_database(args)
+    time_sql(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""Password verification throughput by bcrypt cost and hash pool size.
+
+Each combination runs --threads request-like threads that verify a password
+--logins times in total through project3.passwords.PasswordHasher:
+
+    cd ecomWeb
+    python -m benchmarks.passwords --costs 10 12 --pools 0 2 4
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from project3.passwords import PasswordHasher, _hash
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--costs', type=int, nargs='+', default=[10, 12])
+    parser.add_argument('--pools', type=int, nargs='+', default=[0, 2, 4])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=64)
+    parser.add_argument('--output', help='write results to this JSON file')
+    return parser.parse_args()
+
+
+def run(cost, pool, threads, logins):
+    hasher = PasswordHasher()
+    hasher.rounds, hasher.workers = cost, pool
+    hashed = _hash('benchmark-password', cost)
+    hasher.verify(hashed, 'benchmark-password')  # start the pool outside the timing
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        results = list(executor.map(lambda _: hasher.verify(hashed, 'benchmark-password'), range(logins)))
+    elapsed = time.perf_counter() - started
+    assert all(results)
+
+    if hasher._pool is not None:
+        hasher._pool.shutdown()
+    return {'cost': cost, 'pool': pool, 'logins_per_second': round(logins / elapsed, 2),
+            'ms_per_login': round(elapsed / logins * 1000, 2)}
+
+
+def main():
+    args = parse_args()
+    rows = []
+    print(f"{'cost':>4} {'pool':>4} {'logins/s':>10} {'ms/login':>9}")
+    for cost in args.costs:
+        for pool in args.pools:
+            row = run(cost, pool, args.threads, args.logins)
+            rows.append(row)
+            print(f"{row['cost']:>4} {row['pool']:>4} {row['logins_per_second']:>10} {row['ms_per_login']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
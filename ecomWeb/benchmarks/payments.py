@@ -0,0 +1,134 @@
+"""Payment confirmation latency and worker occupancy benchmark.
+
+Runs project3.fake_stripe in-process with a per-call delay (--delay, default
+FAKE_STRIPE_DELAY or 0.2 s) and, from --users threads, goes through checkout:
+add to cart, create the Checkout Session, then follow the success URL. Each
+confirmation mode runs in a fresh interpreter:
+
+- "sync": payment_success calls Stripe twice and writes the orders itself;
+- "async": PAYMENT_CONFIRM_ASYNC=1, the confirmation runs on the payments
+  thread pool and payment_success returns at once.
+
+"request" is how long payment_success holds a web worker thread (p50/p95);
+"occupancy" sums it over all checkouts per second of wall time, i.e. how
+many worker threads confirmations keep busy. "order" is the time from the
+success URL until the orders exist.
+
+    cd ecomWeb
+    FAKE_STRIPE_DELAY=0.3 python -m benchmarks.payments --users 8 --checkouts 5
+"""
+from threading import Thread
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+STRIPE_PORT = 12112
+PASSWORD = 'benchmark-password'
+MODES = {'sync': {'PAYMENT_CONFIRM_ASYNC': '0'}, 'async': {'PAYMENT_CONFIRM_ASYNC': '1'}}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--checkouts', type=int, default=5, help='checkouts per user')
+    parser.add_argument('--delay', type=float, default=float(os.getenv('FAKE_STRIPE_DELAY', 0.2)))
+    parser.add_argument('--run', choices=list(MODES), help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_mode(args):
+    from werkzeug.serving import make_server
+    from project3.fake_stripe import create_fake_stripe
+
+    server = make_server('127.0.0.1', STRIPE_PORT, create_fake_stripe(args.delay), threaded=True)
+    Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ.update(MODES[args.run], SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'pay.sqlite'),
+                      SECRET_KEY='benchmark', STRIPE_API_KEY='sk_test_benchmark', RATE_LIMIT_ENABLED='0',
+                      STRIPE_API_BASE=f'http://127.0.0.1:{STRIPE_PORT}')
+    from sqlalchemy import insert, select
+    from project3.init import create_app, db, bcrypt
+    from project3.models import Customer, Product, Order
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        password = bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+        db.session.execute(insert(Customer), [
+            {'username': f'payer{i}', 'email': f'payer{i}@example.com', 'password': password} for i in range(args.users)])
+        db.session.add(Product(product_name='Product', current_price_cents=1999, previous_price_cents=2999,
+                               in_stock=10 ** 6))
+        db.session.commit()
+
+    requests, orders = [], []
+
+    def user(number):
+        client = app.test_client()
+        client.post('/auth/login', data={'email': f'payer{number}@example.com', 'password': PASSWORD})
+        for _ in range(args.checkouts):
+            client.get('/add-to-cart/1')
+            success_url = client.post('/create-checkout-session').location
+            payment_id = 'pi_test_' + success_url.rsplit('cs_test_', 1)[1]
+            start = time.perf_counter()
+            client.get(success_url)
+            requests.append(time.perf_counter() - start)
+            with app.app_context():
+                while not db.session.execute(select(Order.id).where(Order.payment_id == payment_id)).first():
+                    db.session.rollback()
+                    time.sleep(0.005)
+            orders.append(time.perf_counter() - start)
+
+    threads = [Thread(target=user, args=(n,)) for n in range(args.users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        'mode': args.run,
+        'request_p50_ms': round(percentile(requests, 0.5) * 1000, 1),
+        'request_p95_ms': round(percentile(requests, 0.95) * 1000, 1),
+        'order_p50_ms': round(percentile(orders, 0.5) * 1000, 1),
+        'order_p95_ms': round(percentile(orders, 0.95) * 1000, 1),
+        'occupancy': round(sum(requests) / elapsed, 2),
+        'checkouts_per_second': round(len(requests) / elapsed, 1),
+    }))
+
+
+def main():
+    args = parse_args()
+    if args.run:
+        return run_mode(args)
+
+    results = []
+    for mode in MODES:
+        command = [sys.executable, '-m', 'benchmarks.payments', '--run', mode, '--users', str(args.users),
+                   '--checkouts', str(args.checkouts), '--delay', str(args.delay)]
+        output = subprocess.run(command, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if output.returncode:
+            sys.exit(output.stderr)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    print(f'Stripe delay {args.delay} s per call, {args.users} users x {args.checkouts} checkouts')
+    print(f"{'mode':6} {'request p50':>12} {'p95':>8} {'order p50':>10} {'p95':>8} {'occupancy':>10} {'checkouts/s':>12}")
+    for row in results:
+        print(f"{row['mode']:6} {row['request_p50_ms']:>12} {row['request_p95_ms']:>8} {row['order_p50_ms']:>10} "
+              f"{row['order_p95_ms']:>8} {row['occupancy']:>10} {row['checkouts_per_second']:>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Database concurrency benchmark.
+
+Runs the cart write path (add_item, change_quantity) and read path
+(cart_items, cart_totals) from many threads against a temporary SQLite file,
+once per settings profile, and reports operations per second, "database is
+locked" errors and pool wait times. "legacy" reproduces the settings before
+engine profiles existed: rollback journal, synchronous=FULL, default pool.
+
+    cd ecomWeb
+    python -m benchmarks.pool --threads 16 --seconds 10
+    python -m benchmarks.pool --database-url postgresql://... --profiles production
+"""
+from threading import Thread
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Environment overrides on top of APP_ENV for each profile
+PROFILES = {
+    'legacy': {'APP_ENV': 'development', 'SQLITE_WAL': '0', 'SQLITE_SYNCHRONOUS': 'FULL', 'DB_MAX_OVERFLOW': '10'},
+    'development': {'APP_ENV': 'development'},
+    'production': {'APP_ENV': 'production'},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--customers', type=int, default=200)
+    parser.add_argument('--products', type=int, default=500)
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file per profile')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--run', help=argparse.SUPPRESS)  # internal: run one profile in this process
+    return parser.parse_args()
+
+
+def seed(app, args):
+    from sqlalchemy import insert
+    from project3.init import db
+    from project3.models import Customer, Product
+
+    with app.app_context():
+        db.session.execute(insert(Customer), [
+            {'username': f'customer{i}', 'email': f'customer{i}@example.com', 'password': 'x'}
+            for i in range(args.customers)])
+        db.session.execute(insert(Product), [
+            {'product_name': f'Product {i}', 'current_price_cents': 1000, 'previous_price_cents': 2000, 'in_stock': 100}
+            for i in range(args.products)])
+        db.session.commit()
+
+
+def worker(app, args, number, deadline, counts):
+    from sqlalchemy.exc import OperationalError
+    from project3.init import db
+    from project3.carts import add_item, change_quantity
+    from project3.queries import cart_items
+    from project3.pricing import cart_totals
+
+    rng = random.Random(number)
+    while time.perf_counter() < deadline:
+        customer_id = rng.randint(1, args.customers)
+        with app.app_context():
+            try:
+                if rng.random() < 0.5:
+                    add_item(customer_id, rng.randint(1, args.products))
+                    change_quantity(customer_id, rng.randint(1, args.products), 1, by_product=True)
+                    db.session.commit()
+                    counts['writes'] += 1
+                else:
+                    cart_items(customer_id)
+                    cart_totals(customer_id)
+                    counts['reads'] += 1
+            except OperationalError as e:
+                db.session.rollback()
+                counts['locked' if 'locked' in str(e) else 'errors'] += 1
+
+
+def run_profile(args):
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'pool.sqlite')
+    os.environ.update(PROFILES[args.run], SQLALCHEMY_DATABASE_URI=database_url, SECRET_KEY='benchmark',
+                      DB_AUTO_MIGRATE='1', RATE_LIMIT_URL='memory://')  # a fresh database every run
+    from project3.init import create_app
+    from project3.metrics import metrics
+
+    app = create_app()
+    seed(app, args)
+
+    counts = [{'reads': 0, 'writes': 0, 'locked': 0, 'errors': 0} for _ in range(args.threads)]
+    deadline = time.perf_counter() + args.seconds
+    threads = [Thread(target=worker, args=(app, args, n, deadline, counts[n])) for n in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    totals = {key: sum(c[key] for c in counts) for key in counts[0]}
+    wait = metrics.pool_wait
+    print(json.dumps({
+        'profile': args.run,
+        'ops_per_second': round((totals['reads'] + totals['writes']) / args.seconds, 1),
+        'writes_per_second': round(totals['writes'] / args.seconds, 1),
+        'reads_per_second': round(totals['reads'] / args.seconds, 1),
+        'locked_errors': totals['locked'],
+        'other_errors': totals['errors'],
+        'pool_checkouts': wait.total,
+        'pool_wait_avg_ms': round(wait.sum / wait.total * 1000, 3) if wait.total else 0,
+    }))
+
+
+def main():
+    args = parse_args()
+    if args.run:
+        return run_profile(args)
+
+    results = []
+    for profile in args.profiles:
+        # A fresh interpreter per profile, so engines and module state don't carry over
+        command = [sys.executable, '-m', 'benchmarks.pool', '--run', profile, '--threads', str(args.threads),
+                   '--seconds', str(args.seconds), '--customers', str(args.customers), '--products', str(args.products)]
+        if args.database_url:
+            command += ['--database-url', args.database_url]
+        output = subprocess.run(command, capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if output.returncode:
+            sys.exit(output.stderr)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    print(f"{'profile':12} {'ops/s':>8} {'writes/s':>9} {'reads/s':>8} {'locked':>7} {'wait ms':>8}")
+    for row in results:
+        print(f"{row['profile']:12} {row['ops_per_second']:>8} {row['writes_per_second']:>9} "
+              f"{row['reads_per_second']:>8} {row['locked_errors']:>7} {row['pool_wait_avg_ms']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
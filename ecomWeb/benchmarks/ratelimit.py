@@ -0,0 +1,70 @@
+"""Rate limiter overhead benchmark.
+
+Calls project3.ratelimit's backend directly, from --threads threads, spread
+over --keys distinct keys (IPs or accounts). Prints the cost per check and
+how many checks were throttled, for the in-memory backend with one shard
+(a single lock) and with the default shards, and for Redis when --redis-url
+is given.
+
+    cd ecomWeb
+    python -m benchmarks.ratelimit --checks 200000 --threads 8 --keys 10000
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checks', type=int, default=200000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--keys', type=int, default=10000)
+    parser.add_argument('--capacity', type=int, default=20)
+    parser.add_argument('--per', type=float, default=60)
+    parser.add_argument('--redis-url', help='also measure the Redis backend')
+    return parser.parse_args()
+
+
+def run(backend, args):
+    rate = args.capacity / args.per
+    share = args.checks // args.threads
+
+    def worker(seed):
+        rng = random.Random(seed)
+        keys = [f'login-ip:10.0.{n // 256}.{n % 256}' for n in range(args.keys)]
+        throttled = 0
+        for _ in range(share):
+            throttled += backend.take(rng.choice(keys), args.capacity, rate) > 0
+        return throttled
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        throttled = sum(executor.map(worker, range(args.threads)))
+    elapsed = time.perf_counter() - start
+    checks = share * args.threads
+    return {'us_per_check': round(elapsed / checks * 1e6, 2), 'checks_per_second': round(checks / elapsed),
+            'throttled': throttled}
+
+
+def main():
+    from project3.ratelimit import MemoryBackend, RedisBackend
+
+    args = parse_args()
+    backends = {'memory, 1 shard': lambda: MemoryBackend(shards=1), 'memory, 64 shards': MemoryBackend}
+    if args.redis_url:
+        backends['redis'] = lambda: RedisBackend(args.redis_url, prefix=f'ratelimit-bench:{time.time()}:')
+
+    print(f'{args.checks} checks, {args.threads} threads, {args.keys} keys, {args.capacity}/{args.per:g}s')
+    print(f"{'backend':<18} {'us/check':>9} {'checks/s':>10} {'throttled':>10}")
+    for name, make in backends.items():
+        row = run(make(), args)
+        print(f"{name:<18} {row['us_per_check']:>9} {row['checks_per_second']:>10} {row['throttled']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Product search benchmark.
+
+Seeds a synthetic catalog (--products, default 100k) with names and
+descriptions drawn from a Zipf-like vocabulary, times the first (blocking)
+index build, then prints p50/p99 of search_index.search for:
+
+- whole words, one and three of them;
+- a last word typed so far, 1, 2 and 4 characters long (prefix expansion);
+
+Each runs three times: with the last word expanded to every matching term
+(as before MIN_PREFIX and MAX_PREFIX_TERMS), bounded, and bounded while a
+background rebuild runs, to show searches keep using the old index instead
+of waiting for it.
+
+    cd ecomWeb
+    python -m benchmarks.search --products 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'ta', 'vo', 'sel', 'qu', 'bra', 'ni', 'po', 'dex', 'fi', 'gor', 'su']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--vocabulary', type=int, default=20000, help='distinct words')
+    parser.add_argument('--repeat', type=int, default=200, help='searches per query kind')
+    parser.add_argument('--seed', type=int, default=1)
+    return parser.parse_args()
+
+
+def vocabulary(rng, size):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words, key=lambda word: rng.random())
+
+
+def seed(app, args, words, weights, rng):
+    from sqlalchemy import insert
+    from project3.init import db
+    from project3.models import Product
+
+    with app.app_context():
+        for start in range(0, args.products, 10000):
+            db.session.execute(insert(Product), [
+                {'product_name': ' '.join(rng.choices(words, weights, k=3)) + f' model{i}',
+                 'description': ' '.join(rng.choices(words, weights, k=12)),
+                 'current_price_cents': 1000, 'previous_price_cents': 1000, 'in_stock': 1}
+                for i in range(start, min(start + 10000, args.products))])
+        db.session.commit()
+
+
+def queries(rng, words, weights, repeat):
+    common = lambda: rng.choices(words[:2000], weights[:2000])[0]
+    return {
+        'one word': [common() for _ in range(repeat)],
+        'three words': [' '.join(common() for _ in range(3)) for _ in range(repeat)],
+        'prefix, 1 char': [f'{common()} {common()[:1]}' for _ in range(repeat)],
+        'prefix, 2 chars': [f'{common()} {common()[:2]}' for _ in range(repeat)],
+        'prefix, 4 chars': [f'{common()} {common()[:4]}' for _ in range(repeat)],
+    }
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(search_index, kinds):
+    results = {}
+    for kind, texts in kinds.items():
+        timings = []
+        for text in texts:
+            start = time.perf_counter()
+            search_index.search(text)
+            timings.append(time.perf_counter() - start)
+        results[kind] = (percentile(timings, 0.5) * 1000, percentile(timings, 0.99) * 1000)
+    return results
+
+
+def main():
+    args = parse_args()
+    os.environ.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'search.sqlite'),
+                      SECRET_KEY='benchmark')
+    from project3.init import create_app
+    from project3 import search
+    from project3.search import search_index
+
+    rng = random.Random(args.seed)
+    words = vocabulary(rng, args.vocabulary)
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    app = create_app()
+    seed(app, args, words, weights, rng)
+    kinds = queries(rng, words, weights, args.repeat)
+
+    with app.app_context():
+        start = time.perf_counter()
+        search_index.ensure_built()
+        print(f'{args.products} products, {len(search_index.index.terms)} terms, '
+              f'first build {time.perf_counter() - start:.2f}s')
+        bounds = search.MIN_PREFIX, search.MAX_PREFIX_TERMS
+        search.MIN_PREFIX, search.MAX_PREFIX_TERMS = 1, len(search_index.index.terms)
+        unbounded = measure(search_index, kinds)
+        search.MIN_PREFIX, search.MAX_PREFIX_TERMS = bounds
+        bounded = measure(search_index, kinds)
+
+        search_index.stale = True
+        search_index.ensure_built()  # starts the background rebuild
+        rebuild = search_index.thread
+        busy = measure(search_index, kinds)
+        busy_overlap = rebuild.is_alive()
+        start = time.perf_counter()
+        rebuild.join()
+        print(f'background rebuild still running at the end of the second pass: {busy_overlap} '
+              f'(finished {time.perf_counter() - start:.2f}s later)')
+
+    print(f"{'':18} {'unbounded':>19} {'bounded':>19} {'rebuilding':>19}")
+    print(f"{'query':18}" + f" {'p50 ms':>9} {'p99 ms':>9}" * 3)
+    for kind in kinds:
+        print(f'{kind:18}' + ''.join(f' {p50:>9.2f} {p99:>9.2f}' for p50, p99 in
+                                     (unbounded[kind], bounded[kind], busy[kind])))
+
+
+if __name__ == '__main__':
+    main()
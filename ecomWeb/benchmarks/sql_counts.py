@@ -0,0 +1,107 @@
+"""SQL statements per request, checked against data size.
+
+For each --sizes value, a fresh interpreter seeds a throwaway database whose
+one customer (an admin) has that many cart lines and order lines, and as
+many other customers one order each, signs in,
+requests /cart, /orders and /admin/view_orders and reads the per-endpoint
+statement count project3.metrics records. A page whose count changes with
+the number of rows is an N+1 query, and the script exits non-zero:
+
+    cd ecomWeb
+    python -m benchmarks.sql_counts --sizes 1 50 500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'benchmark-password'
+PAGES = {'views.cart': '/cart', 'views.orders': '/orders', 'admin.view_orders': '/admin/view_orders'}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 50, 500])
+    parser.add_argument('--run', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def count(rows):
+    os.environ.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'counts.sqlite'),
+                      SECRET_KEY='benchmark', RATE_LIMIT_ENABLED='0', ADMIN_IDS='1')
+    from sqlalchemy import insert
+    from project3.init import create_app, db, bcrypt
+    from project3.metrics import metrics
+    from project3.models import Customer, Product, Cart, Order
+    from project3.reporting import rebuild
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        password = bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+        db.session.add(Customer(username='admin', email='admin@example.com', password=password))
+        db.session.execute(insert(Product), [
+            {'product_name': f'Product {i}', 'current_price_cents': 1000 + i, 'previous_price_cents': 2000,
+             'in_stock': 100} for i in range(rows)])
+        db.session.execute(insert(Cart), [
+            {'customer_link': 1, 'product_link': i + 1, 'quantity': 1} for i in range(rows)])
+        db.session.execute(insert(Order), [
+            {'customer_link': 1, 'product_link': i + 1, 'price_cents': 1000 + i, 'quantity': 1,
+             'status': 'Pending', 'payment_id': f'pi_{i // 2}'} for i in range(rows)])
+        # Orders from as many other customers, so the admin list spans `rows` customers
+        db.session.execute(insert(Customer), [
+            {'username': f'customer{i}', 'email': f'customer{i}@example.com', 'password': password}
+            for i in range(rows)])
+        db.session.execute(insert(Order), [
+            {'customer_link': i + 2, 'product_link': i + 1, 'price_cents': 1000 + i, 'quantity': 1,
+             'status': 'Pending', 'payment_id': f'pi_other_{i}'} for i in range(rows)])
+        db.session.commit()
+        with db.engine.begin() as conn:
+            rebuild(conn)
+
+    client = app.test_client()
+    client.post('/auth/login', data={'email': 'admin@example.com', 'password': PASSWORD})
+    counts = {}
+    for endpoint, path in PAGES.items():
+        # The first request: a cached fragment would hide an N+1 in its template,
+        # while cache misses only add a fixed number of statements
+        before = metrics.sql_statements[endpoint]
+        response = client.get(path)
+        if response.status_code != 200:
+            sys.exit(f'{path} returned {response.status_code}')
+        counts[endpoint] = metrics.sql_statements[endpoint] - before
+    print(json.dumps(counts))
+
+
+def main():
+    args = parse_args()
+    if args.run is not None:
+        return count(args.run)
+
+    results = {}
+    for rows in args.sizes:
+        output = subprocess.run([sys.executable, '-m', 'benchmarks.sql_counts', '--run', str(rows)],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        if output.returncode:
+            sys.exit(output.stderr)
+        results[rows] = json.loads(output.stdout.strip().splitlines()[-1])
+
+    print(f"{'endpoint':20}" + ''.join(f'{f"{rows} rows":>10}' for rows in args.sizes))
+    failed = []
+    for endpoint in PAGES:
+        counts = [results[rows][endpoint] for rows in args.sizes]
+        print(f'{endpoint:20}' + ''.join(f'{c:>10}' for c in counts))
+        if len(set(counts)) > 1:
+            failed.append(endpoint)
+    if failed:
+        sys.exit(f'statement count grows with rows: {", ".join(failed)}')
+    print('ok: statement counts do not depend on the number of rows')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Worker startup benchmark.
+
+Boot: in a fresh interpreter per variant, the time from the first import to
+a built app, the number of modules loaded and the RSS. "eager" reproduces
+create_app before lazy initialization: stripe, requests and Pillow imported
+up front, and the migration check on every boot. "lazy" is the production
+profile as it is now.
+
+Workers: forks --workers processes that each serve a few requests through
+the test client, then reads their memory from /proc/self/smaps_rollup
+(Linux). It compares two setups:
+
+- "fork": every worker imports and builds the app itself, as gunicorn does
+  without preload_app;
+- "preload": the parent builds the app and runs warm_up, and the workers
+  fork from it (gunicorn.conf.py).
+
+USS is the memory a worker does not share, i.e. what one more worker costs.
+
+    cd ecomWeb
+    python -m benchmarks.startup --workers 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ECOMWEB = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOOT_VARIANTS = {
+    'eager': {'APP_ENV': 'production', 'DB_AUTO_MIGRATE': '1'},
+    'lazy': {'APP_ENV': 'production'},
+}
+WORKER_VARIANTS = ['fork', 'preload']
+PATHS = ['/', '/auth/login', '/search?q=product']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5, help='boots per variant; the median is reported')
+    parser.add_argument('--boot', choices=list(BOOT_VARIANTS), help=argparse.SUPPRESS)
+    parser.add_argument('--serve', choices=WORKER_VARIANTS, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def memory():
+    # kB from smaps_rollup; USS = private clean + private dirty
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return {'rss_mb': round(values['Rss'] / 1024, 1),
+            'uss_mb': round((values['Private_Clean'] + values['Private_Dirty']) / 1024, 1)}
+
+
+def boot(variant):
+    start = time.perf_counter()
+    if variant == 'eager':
+        import PIL.Image, requests, stripe  # noqa: F401  what create_app used to import
+    from project3.init import create_app
+    create_app()
+    print(json.dumps(dict(memory(), boot_ms=round((time.perf_counter() - start) * 1000, 1),
+                          modules=len(sys.modules))))
+
+
+def serve(variant, workers):
+    app = None
+    if variant == 'preload':
+        os.environ['PRELOAD'] = '1'
+        from project3.init import create_app, warm_up
+        app = create_app()
+        warm_up(app)
+
+    children = []
+    for _ in range(workers):
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read)
+            start = time.perf_counter()
+            if app is None:
+                from project3.init import create_app
+                worker_app = create_app()
+            else:
+                from project3.init import after_fork
+                worker_app = app
+                after_fork(worker_app)
+            ready_ms = round((time.perf_counter() - start) * 1000, 1)
+            client = worker_app.test_client()
+            for path in PATHS * 5:
+                client.get(path)
+            os.write(write, json.dumps(dict(memory(), ready_ms=ready_ms)).encode())
+            os._exit(0)
+        os.close(write)
+        children.append((pid, read))
+
+    results = []
+    for pid, read in children:
+        with os.fdopen(read) as f:
+            results.append(json.loads(f.read()))
+        os.waitpid(pid, 0)
+    print(json.dumps({key: round(sum(r[key] for r in results) / len(results), 1) for key in results[0]}))
+
+
+def run(args, env):
+    output = subprocess.run([sys.executable, '-m', 'benchmarks.startup'] + args, capture_output=True, text=True,
+                            cwd=ECOMWEB, env=dict(os.environ, **env))
+    if output.returncode:
+        sys.exit(output.stderr)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    if args.boot:
+        return boot(args.boot)
+    if args.serve:
+        return serve(args.serve, args.workers)
+
+    env = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'startup.sqlite'),
+           'SECRET_KEY': 'benchmark', 'APP_ENV': 'production', 'RATE_LIMIT_URL': 'memory://'}
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'wsgi', 'upgrade-db'], check=True, cwd=ECOMWEB,
+                   env=dict(os.environ, **env), capture_output=True)
+
+    print(f"{'boot':8} {'ms':>8} {'modules':>8} {'RSS MB':>7}")
+    for variant, overrides in BOOT_VARIANTS.items():
+        runs = sorted((run(['--boot', variant], dict(env, **overrides)) for _ in range(args.repeat)),
+                      key=lambda r: r['boot_ms'])
+        row = runs[len(runs) // 2]
+        print(f"{variant:8} {row['boot_ms']:>8} {row['modules']:>8} {row['rss_mb']:>7}")
+
+    print(f"\n{args.workers} workers, per worker")
+    print(f"{'setup':8} {'ready ms':>9} {'RSS MB':>7} {'USS MB':>7}")
+    for variant in WORKER_VARIANTS:
+        row = run(['--serve', variant, '--workers', str(args.workers)], env)
+        print(f"{variant:8} {row['ready_ms']:>9} {row['rss_mb']:>7} {row['uss_mb']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Storefront benchmark.
+
+Seeds a throwaway database through the models, then drives the real
+create_app() app through the customer journeys (home, add to cart, cart,
+plus/minus, checkout, orders) from several threads, with Stripe replaced by
+project3.fake_stripe. Prints throughput and p50/p95/p99 per endpoint and
+writes them to JSON so runs can be compared across commits:
+
+    cd ecomWeb
+    python -m benchmarks.storefront --output before.json
+    python -m benchmarks.storefront --output after.json --compare before.json
+
+Each journey clicks + twice and - once on two cart lines. --cart-api sends
+those clicks the way the cart page now does, as one PATCH /api/cart.
+"""
+from collections import defaultdict
+from datetime import datetime
+from threading import Thread
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'benchmark-password'
+STRIPE_PORT = 12111
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--customers', type=int, default=200)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--carts', type=int, default=2000, help='cart lines seeded for other customers')
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=8, help='concurrent virtual users')
+    parser.add_argument('--journeys', type=int, default=20, help='journeys per virtual user')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--compare', help='previous results JSON to compare against')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cart-api', action='store_true', help='batch +/- clicks into one PATCH /api/cart')
+    return parser.parse_args()
+
+
+def start_fake_stripe():
+    from werkzeug.serving import make_server
+    from project3.fake_stripe import create_fake_stripe
+
+    server = make_server('127.0.0.1', STRIPE_PORT, create_fake_stripe(), threaded=True)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def build_app(args):
+    database_url = args.database_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.sqlite')
+    os.environ.update(SQLALCHEMY_DATABASE_URI=database_url, SECRET_KEY='benchmark',
+                      STRIPE_API_KEY='sk_test_benchmark', STRIPE_API_BASE=f'http://127.0.0.1:{STRIPE_PORT}',
+                      RATE_LIMIT_ENABLED='0')  # every simulated customer shares 127.0.0.1
+    from project3.init import create_app
+
+    app = create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    return app
+
+
+def seed(app, args):
+    from sqlalchemy import insert
+    from project3.init import db, bcrypt
+    from project3.models import Customer, Product, Cart, Order
+    from project3.reporting import rebuild
+
+    rng = random.Random(args.seed)
+    password = bcrypt.generate_password_hash(PASSWORD).decode('utf-8')  # hashed once, shared by everyone
+
+    with app.app_context():
+        db.session.execute(insert(Customer), [
+            {'username': f'customer{i}', 'email': f'customer{i}@example.com', 'password': password}
+            for i in range(args.customers)])
+        db.session.execute(insert(Product), [
+            {'product_name': f'Product {i}', 'description': f'Benchmark product number {i}',
+             'current_price_cents': rng.randint(100, 50000), 'previous_price_cents': 60000,
+             'in_stock': 10 ** 6, 'flash_sale': i % 10 == 0}
+            for i in range(args.products)])
+
+        # Journey users are the last --users customers; the rest get background data
+        others = max(args.customers - args.users, 1)
+        lines = {(rng.randint(1, others), rng.randint(1, args.products)) for _ in range(args.carts)}
+        if lines:
+            db.session.execute(insert(Cart), [
+                {'customer_link': c, 'product_link': p, 'quantity': rng.randint(1, 5)} for c, p in lines])
+        if args.orders:
+            db.session.execute(insert(Order), [
+                {'customer_link': rng.randint(1, args.customers), 'product_link': rng.randint(1, args.products),
+                 'price_cents': 1000, 'quantity': 1, 'status': 'Paid', 'payment_id': f'pi_seed_{i // 3}'}
+                for i in range(args.orders)])
+        db.session.commit()
+        with db.engine.begin() as conn:
+            rebuild(conn)  # order headers and revenue summaries for the seeded orders
+
+
+def run_user(app, args, number, timings, errors):
+    from project3.models import Cart
+
+    rng = random.Random(args.seed + number)
+    client = app.test_client()
+    customer_index = args.customers - args.users + number
+    email = f'customer{customer_index}@example.com'
+
+    def call(name, method, url, **kwargs):
+        start = time.perf_counter()
+        response = getattr(client, method)(url, **kwargs)
+        timings[name].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            errors[name] += 1
+        return response
+
+    call('auth.login', 'post', '/auth/login', data={'email': email, 'password': PASSWORD})
+    for _ in range(args.journeys):
+        call('views.home', 'get', '/')
+        for product_id in rng.sample(range(1, args.products + 1), 3):
+            call('views.add_to_cart', 'get', f'/add-to-cart/{product_id}')
+        call('views.cart', 'get', '/cart')
+
+        with app.app_context():
+            cart_ids = [c.id for c in Cart.query.filter_by(customer_link=customer_index + 1)]
+        if args.cart_api:
+            call('views.cart_api', 'patch', '/api/cart', json={'deltas': {cart_id: 1 for cart_id in cart_ids[:2]}})
+        else:
+            for cart_id in cart_ids[:2]:
+                call('views.plus_cart', 'get', f'/pluscart?cart_id={cart_id}')
+                call('views.plus_cart', 'get', f'/pluscart?cart_id={cart_id}')
+                call('views.minus_cart', 'get', f'/minuscart?cart_id={cart_id}')
+
+        response = call('views.create_checkout_session', 'post', '/create-checkout-session')
+        if response.status_code == 303:
+            call('views.payment_success', 'get', response.location)
+        call('views.orders', 'get', '/orders')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    args = parse_args()
+    server = start_fake_stripe()
+    app = build_app(args)
+
+    started = time.perf_counter()
+    seed(app, args)
+    seed_seconds = time.perf_counter() - started
+
+    timings = defaultdict(list)
+    errors = defaultdict(int)
+    users = [Thread(target=run_user, args=(app, args, n, timings, errors)) for n in range(args.users)]
+    started = time.perf_counter()
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    total_requests = sum(len(v) for v in timings.values())
+    results = {
+        'commit': git_commit(),
+        'date': datetime.utcnow().isoformat(),
+        'params': vars(args),
+        'seed_seconds': round(seed_seconds, 3),
+        'elapsed_seconds': round(elapsed, 3),
+        'journeys_per_second': round(args.users * args.journeys / elapsed, 2),
+        'requests_per_second': round(total_requests / elapsed, 2),
+        'requests_per_journey': round(total_requests / (args.users * args.journeys), 2),
+        'endpoints': {
+            name: {
+                'requests': len(values),
+                'errors': errors[name],
+                'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+            } for name, values in sorted(timings.items())},
+    }
+    report(results, args.compare)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+def report(results, compare=None):
+    previous = {}
+    if compare:
+        with open(compare) as f:
+            previous = json.load(f).get('endpoints', {})
+
+    print(f"{results['requests_per_second']} req/s, {results['journeys_per_second']} journeys/s "
+          f"over {results['elapsed_seconds']}s (commit {results['commit']})")
+    print(f"{results['requests_per_journey']} requests per journey")
+    print(f"{'endpoint':32} {'n':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, row in results['endpoints'].items():
+        line = f"{name:32} {row['requests']:>6} {row['errors']:>4} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}"
+        if name in previous and previous[name]['p95_ms']:
+            change = (row['p95_ms'] - previous[name]['p95_ms']) / previous[name]['p95_ms'] * 100
+            line += f"   p95 {change:+.1f}%"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+# gunicorn -c gunicorn.conf.py, from ecomWeb/. Run `flask --app wsgi upgrade-db`
+# once per deploy first: with APP_ENV=production workers don't migrate at boot.
+# Production also needs RATE_LIMIT_URL=redis://..., so the workers share limits.
+import multiprocessing
+import os
+
+os.environ.setdefault('APP_ENV', 'production')
+os.environ['PRELOAD'] = '1'  # background threads start in post_fork, not in the master
+
+wsgi_app = 'wsgi:app'
+bind = os.getenv('BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))  # recycle workers after this many requests
+max_requests_jitter = max_requests // 10
+accesslog = '-'
+
+# The app is imported and built once in the master and the workers fork from
+# it, so its modules and compiled templates are shared pages rather than loaded
+# again by every worker, and a worker starts in milliseconds.
+preload_app = True
+
+
+def when_ready(server):
+    from wsgi import app
+    from project3.init import warm_up
+    warm_up(app)
+
+
+def post_fork(server, worker):
+    from wsgi import app
+    from project3.init import after_fork
+    after_fork(app)
@@ -1,9 +1,10 @@
 from project3.init import create_app
 from project3.authen import auth
+import os
 
 
 app = create_app()
 
 
 if __name__ == '__main__':    
-    app.run(debug=True) 
\ No newline at end of file
+    app.run(debug=os.getenv("FLASK_DEBUG") == "1")  # development only; production runs wsgi.py under gunicorn
\ No newline at end of file
@@ -1,9 +1,20 @@
-from flask import Blueprint, render_template, flash, current_app, send_from_directory,redirect, request
+from flask import Blueprint, render_template, flash, current_app, redirect, request, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
-from .forms import ShopItems, OrdersForm
-from werkzeug.utils import secure_filename
+from .forms import ShopItems, OrdersForm, ImportProducts
 from .models import Product, Order, Customer
 from .init import db  # Import the db object to interact with the database
+from .queries import all_orders, order_page, keyset_page, PAGE_SIZE
+from .exports import export_rows, EXPORTS, EXPORT_FORMATS
+from .imports import import_products, guess_format, upload_stream
+from .catalog import catalog_cache
+from .jobs import job_queue
+from .images import images
+from .assets import assets
+from .replicas import read_replica
+from .money import to_cents, from_cents
+from .reporting import record_status_change, kpis
+from .fragments import conditional
+import json
 import os
 
 admin = Blueprint("admin", '__name__')
@@ -11,10 +22,10 @@ admin = Blueprint("admin", '__name__')
 
 @admin.route('/media/<path:filename>')    
 def get_image(filename):
-    return send_from_directory('static/media', filename) 
+    return assets.send(os.path.join(current_app.static_folder, 'media'), filename, prefix='media/') 
 @admin.route('/add-shop-items', methods=['GET', 'POST'])
 def add_shop_items():
-    if current_user.id == 1:
+    if current_user.is_admin:
         form = ShopItems()
         if form.validate_on_submit():
             product_name = form.product_name.data 
@@ -24,18 +35,12 @@ def add_shop_items():
             flash_sale = form.flash_sale.data
 
             file = form.product_picture.data
-            file_name = secure_filename(file.filename)
-           
-            save_path = os.path.join(current_app.root_path, 'static', 'media', file_name)
-
-           
-            file_path = f'/static/media/{file_name}'
-            file.save(save_path)
+            file_path = images.save_upload(file)  # resized renditions are built in the background
 
             new_shop_items = Product()
             new_shop_items.product_name = product_name
-            new_shop_items.current_price = current_price
-            new_shop_items.previous_price = previous_price
+            new_shop_items.current_price_cents = to_cents(current_price)
+            new_shop_items.previous_price_cents = to_cents(previous_price)
             new_shop_items.in_stock = in_stock
             new_shop_items.product_picture = file_path 
 
@@ -55,25 +60,43 @@ def add_shop_items():
         return render_template('add-shop-items.html', form=form)
     return render_template('404.html')
 
+@admin.route('/import-products', methods=['GET', 'POST'])
+@login_required
+def import_shop_items():
+    if current_user.is_admin:
+        form = ImportProducts()
+        if form.validate_on_submit():
+            file = form.products_file.data
+            rows = import_products(upload_stream(file), guess_format(file.filename))
+            # One JSON line per chunk as it is written, the last one is the summary
+            return Response(stream_with_context(json.dumps(stats) + '\n' for stats in rows), mimetype='text/plain')
+
+        return render_template('import_products.html', form=form)
+    return render_template('404.html')
+
 @admin.route('/shop-items', methods=['GET', 'POST'])
 @login_required
+@read_replica
+@conditional
 def shop_items():
-    if current_user.id == 1:
-        items = Product.query.order_by(Product.date_added).all()
+    if current_user.is_admin:
+        after = request.args.get('after', 0, type=int)
+        size = request.args.get('size', PAGE_SIZE, type=int)
+        items, next_cursor = keyset_page(Product.query, Product.id, after, size)  # id follows date_added
 
-        return render_template('shop_items.html', items=items)
+        return render_template('shop_items.html', items=items, next_cursor=next_cursor, size=size)
     return render_template('404.html')
 
 @admin.route('/update-item/<int:id>', methods=['GET', 'POST'])
 @login_required
 def update_item(id):
-    if current_user.id == 1:
+    if current_user.is_admin:
         form = ShopItems()
         item = Product.query.get(id)        
         if request.method == 'GET':
             form.product_name.data = item.product_name    
-            form.current_price.data = item.current_price
-            form.previous_price.data = item.previous_price
+            form.current_price.data = from_cents(item.current_price_cents)
+            form.previous_price.data = from_cents(item.previous_price_cents)
             form.in_stock.data = item.in_stock
             form.flash_sale.data = item.flash_sale
 
@@ -85,15 +108,11 @@ def update_item(id):
             flash_sale = form.flash_sale.data
 
             file = form.product_picture.data
-            save_path = os.path.join(current_app.root_path, 'static', 'media', file.filename)
-            file_name = secure_filename(file.filename)
-            file_path = (f'/static/media/{file_name}')
-
-            file.save(save_path) 
+            file_path = images.save_upload(file)
             try:      
                 Product.query.filter_by(id=id).update(dict( product_name=product_name,          
-                                                            current_price=current_price,
-                                                            previous_price=previous_price,
+                                                            current_price_cents=to_cents(current_price),
+                                                            previous_price_cents=to_cents(previous_price),
                                                             in_stock=in_stock,
                                                             flash_sale=flash_sale,
                                                             product_picture=file_path))    
@@ -112,7 +131,7 @@ def update_item(id):
 @admin.route('/delete-item/<int:id>', methods=['GET', 'POST'])
 @login_required
 def delete_item(id):
-    if current_user.id == 1:
+    if current_user.is_admin:
         try:
             item = Product.query.get(id)
                 
@@ -128,17 +147,21 @@ def delete_item(id):
 
 
 @admin.route('/view_orders')
+@read_replica
+@conditional
 def view_orders():
-    if current_user.id == 1:
-        orders = Order.query.all()
-        return render_template('view_order.html', orders=orders)
+    if current_user.is_admin:
+        after = request.args.get('after', 0, type=int)
+        size = request.args.get('size', PAGE_SIZE, type=int)
+        orders, next_cursor = order_page(all_orders(), after, size)
+        return render_template('view_order.html', orders=orders, next_cursor=next_cursor, size=size)
     return render_template('404.html')
 
 
 @admin.route('/update_order/<int:id>', methods=['GET', 'POST'])
 @login_required
 def update_order(id):
-    if current_user.id == 1:
+    if current_user.is_admin:
         form = OrdersForm()
         order = Order.query.get(id) 
 
@@ -147,7 +170,9 @@ def update_order(id):
 
         if form.validate_on_submit():
             status = form.order_status.data
+            old_status = order.status
             order.status = status  
+            record_status_change(order, old_status)
             
             try:
                 db.session.commit() 
@@ -168,17 +193,49 @@ def update_order(id):
 
 @admin.route('/customers')
 @login_required
+@read_replica
 def customers():
-    if current_user.id == 1:
-        customers = Customer.query.all()
-        return render_template('customers.html', customers=customers)
+    if current_user.is_admin:
+        after = request.args.get('after', 0, type=int)
+        size = request.args.get('size', PAGE_SIZE, type=int)
+        customers, next_cursor = keyset_page(Customer.query, Customer.id, after, size)
+        return render_template('customers.html', customers=customers, next_cursor=next_cursor, size=size)
+    return render_template('404.html')
+
+
+@admin.route('/export/<kind>')
+@login_required
+def export(kind):
+    if current_user.is_admin:
+        fmt = request.args.get('format', 'csv')
+        if kind not in EXPORTS or fmt not in EXPORT_FORMATS:
+            return render_template('404.html')
+
+        return Response(stream_with_context(export_rows(kind, fmt)), mimetype=EXPORT_FORMATS[fmt],
+                        headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'})
     return render_template('404.html')
 
 
 @admin.route('/admin_home')
 @login_required
 def admin_home():
-    if current_user.id == 1:
-        return render_template('admin_home.html')
+    if current_user.is_admin:
+        return render_template('admin_home.html', kpis=kpis())
+
+    return render_template('404.html')
 
+
+@admin.route('/catalog-cache')
+@login_required
+def catalog_cache_stats():
+    if current_user.is_admin:
+        return jsonify(catalog_cache.stats())
+    return render_template('404.html')
+
+
+@admin.route('/jobs')
+@login_required
+def job_stats():
+    if current_user.is_admin:
+        return jsonify(job_queue.stats())
     return render_template('404.html')
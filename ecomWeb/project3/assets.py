@@ -0,0 +1,104 @@
+from flask import request, send_file, url_for, abort
+from werkzeug.security import safe_join
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip variants are always built
+    brotli = None
+
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.html', '.json', '.txt')
+ONE_YEAR = 31536000
+HASHED_MEDIA = re.compile(r'^media/[0-9a-f]{20}(-\w+)?\.\w+$')  # content-hash names from images.py
+
+
+class AssetPipeline:
+    def __init__(self):
+        self.manifest = {}
+        self.static_dir = None
+        self.compressed_dir = None
+
+    def init_app(self, app):
+        self.static_dir = app.static_folder
+        self.compressed_dir = os.path.join(app.instance_path, 'precompressed')
+        self.build()
+
+        app.view_functions['static'] = self.serve
+        app.add_template_global(self.asset_url, 'asset_url')
+
+    def build(self):
+        # Fingerprint every static file (uploaded media is already content-hashed)
+        # and keep gzip/brotli copies of the text assets next to them.
+        for root, dirs, files in os.walk(self.static_dir):
+            dirs[:] = [d for d in dirs if d != 'media']
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, self.static_dir).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    data = f.read()
+                self.manifest[filename] = hashlib.sha256(data).hexdigest()[:12]
+                if filename.endswith(COMPRESSIBLE):
+                    self._precompress(filename, path, data)
+
+    def _precompress(self, filename, path, data):
+        variants = [('.gz', lambda d: gzip.compress(d, 9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', lambda d: brotli.compress(d, quality=11)))
+
+        for suffix, compress in variants:
+            target = os.path.join(self.compressed_dir, filename + suffix)
+            if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(path):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target + '.tmp', 'wb') as f:
+                f.write(compress(data))
+            os.replace(target + '.tmp', target)
+
+    def asset_url(self, filename):
+        # url_for('static') plus the content hash, which makes the URL safe to cache forever
+        version = self.manifest.get(filename)
+        if version is None:
+            return url_for('static', filename=filename)
+        return url_for('static', filename=filename, v=version)
+
+    def serve(self, filename):
+        return self.send(self.static_dir, filename, prefix='')
+
+    def send(self, directory, filename, prefix):
+        path = safe_join(directory, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        key = prefix + filename
+        immutable = (request.args.get('v') is not None and request.args.get('v') == self.manifest.get(key)) \
+            or bool(HASHED_MEDIA.match(key))
+
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encoding, variant = self._variant(key)
+        response = send_file(variant or path, mimetype=mimetype, conditional=True, etag=True,
+                             max_age=ONE_YEAR if immutable else None)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if key.endswith(COMPRESSIBLE):
+            response.vary.add('Accept-Encoding')
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
+
+    def _variant(self, key):
+        accepted = request.accept_encodings
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[encoding]:
+                variant = os.path.join(self.compressed_dir, key + suffix)
+                if os.path.exists(variant):
+                    return encoding, variant
+        return None, None
+
+
+assets = AssetPipeline()
@@ -1,26 +1,32 @@
-from flask_bcrypt import check_password_hash
 from flask import Blueprint, render_template, flash, redirect
 from .forms import Signup_Form, Login_Form, ChangePassword
 from .models import Customer, db
-from .init import bcrypt  
+from .passwords import hasher  
+from .ratelimit import rate_limit, by_form
 from flask_login import login_user, logout_user, current_user, login_required
 
 auth = Blueprint("auth", __name__)  
 
 @auth.route("/login", methods=['GET', 'POST'])
+@rate_limit('login-ip', 20, 60, methods=('POST',))
+@rate_limit('login-account', 5, 60, key=by_form('email'), methods=('POST',))
 def login():
     form = Login_Form()
     if form.validate_on_submit():
         email = form.email.data
         password = form.password.data
         customer = Customer.query.filter_by(email=email).first()
-        if customer and check_password_hash(customer.password, password):
+        if customer and customer.verify_password(password):
+            if hasher.needs_rehash(customer.password):
+                customer.set_password(password)  # upgrade hashes made with a lower cost
+                db.session.commit()
             login_user(customer) 
             flash('Login successful!', 'success')
             return redirect('/home')
     return render_template('login.html', form=form)
 
 @auth.route("/Signup", methods=['GET', 'POST'])
+@rate_limit('signup-ip', 10, 3600, methods=('POST',))
 def Signup():
     form = Signup_Form()
     if form.validate_on_submit():
@@ -35,7 +41,7 @@ def Signup():
             return redirect('/Signup')
 
         if password == confirm_password:
-            password_h = bcrypt.generate_password_hash(password).decode('utf-8')  
+            password_h = hasher.hash(password)  
             new_customer = Customer(username=username, email=email, password=password_h)            
         
             db.session.add(new_customer)
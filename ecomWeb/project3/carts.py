@@ -0,0 +1,73 @@
+from sqlalchemy import update, select, case
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from .models import Cart
+from .init import db
+
+
+# Cart quantities are changed with single UPDATE / upsert statements evaluated
+# by the database, so two quick clicks can't overwrite each other's result.
+
+UPSERTS = {'sqlite': sqlite_insert, 'postgresql': pg_insert}
+MAX_BATCH = 100  # lines per PATCH /api/cart
+MAX_DELTA = 100  # quantity change per line per PATCH; far more than a burst of clicks
+
+
+def add_item(customer_id, product_id):
+    insert = UPSERTS.get(db.engine.dialect.name)
+    if insert is not None:
+        stmt = insert(Cart).values(customer_link=customer_id, product_link=product_id, quantity=1)
+        stmt = stmt.on_conflict_do_update(index_elements=['customer_link', 'product_link'],
+                                          set_={'quantity': Cart.quantity + 1})
+        quantity = db.session.execute(stmt.returning(Cart.quantity)).scalar()
+        db.session.commit()
+        return quantity
+
+    # No native upsert: bump the existing line, insert if there was none and
+    # fall back to the bump when a concurrent insert won the unique index.
+    quantity = change_quantity(customer_id, product_id, 1, by_product=True)
+    if quantity is not None:
+        return quantity
+    try:
+        db.session.add(Cart(customer_link=customer_id, product_link=product_id, quantity=1))
+        db.session.commit()
+        return 1
+    except IntegrityError:
+        db.session.rollback()
+        return change_quantity(customer_id, product_id, 1, by_product=True)
+
+
+def change_quantity(customer_id, cart_id, delta, by_product=False):
+    # Returns the new quantity, or None if the line isn't in this customer's cart.
+    # A line never drops below 1; removing it is remove_item's job.
+    key = Cart.product_link if by_product else Cart.id
+    condition = (key == cart_id) & (Cart.customer_link == customer_id)
+
+    stmt = update(Cart).where(condition, Cart.quantity + delta >= 1) \
+        .values(quantity=Cart.quantity + delta).execution_options(synchronize_session=False)
+
+    if db.engine.dialect.update_returning:
+        quantity = db.session.execute(stmt.returning(Cart.quantity)).scalar()
+    else:
+        db.session.execute(stmt)
+        quantity = None
+
+    if quantity is None:
+        quantity = db.session.execute(select(Cart.quantity).where(condition)).scalar()
+    db.session.commit()
+    return quantity
+
+
+def apply_deltas(customer_id, deltas):
+    # A batch of +/- clicks, {cart_id: delta}, applied in one transaction. Lines
+    # are clamped at 1 like change_quantity. Returns the ids not in this cart.
+    missing = []
+    for cart_id, delta in deltas.items():
+        quantity = case((Cart.quantity + delta < 1, 1), else_=Cart.quantity + delta)
+        stmt = update(Cart).where(Cart.id == cart_id, Cart.customer_link == customer_id) \
+            .values(quantity=quantity).execution_options(synchronize_session=False)
+        if db.session.execute(stmt).rowcount == 0:
+            missing.append(cart_id)
+    db.session.commit()
+    return missing
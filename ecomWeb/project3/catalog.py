@@ -0,0 +1,64 @@
+from .caches import LRUCache, RedisCache
+from .changes import changes
+from .models import Product
+from .replicas import on_primary
+
+
+class CatalogCache:
+    def __init__(self):
+        self.backend = LRUCache()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        ttl = app.config.get('CATALOG_CACHE_TTL', 60)
+        url = app.config.get('CATALOG_CACHE_URL')
+        self.backend = RedisCache(url, ttl=ttl) if url else LRUCache(ttl=ttl)
+
+    def get_or_load(self, key, loader):
+        value = self.backend.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        self.misses += 1
+        with on_primary():
+            value = loader()
+        self.backend.set(key, value)
+        return value
+
+    def invalidate(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+catalog_cache = CatalogCache()
+
+
+def product_dict(product):
+    # Plain values only, so cached entries outlive the session that loaded them
+    return {
+        'id': product.id,
+        'product_name': product.product_name,
+        'description': product.description,
+        'current_price_cents': product.current_price_cents,
+        'previous_price_cents': product.previous_price_cents,
+        'currency': product.currency,
+        'product_picture': product.product_picture,
+        'in_stock': product.in_stock,
+        'flash_sale': product.flash_sale,
+    }
+
+
+def flash_sale_items():
+    return catalog_cache.get_or_load(
+        'flash_sale',
+        lambda: [product_dict(p) for p in Product.query.filter_by(flash_sale=True)])
+
+
+# Drop cached catalog reads whenever a commit touched a Product
+
+@changes.subscribe(Product)
+def _invalidate_catalog(rows, bulk):
+    catalog_cache.invalidate()
@@ -0,0 +1,100 @@
+from itertools import chain
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+
+class ChangeTracker:
+    # Records which rows and columns a session wrote, through the unit of work
+    # or bulk statements, and hands them to the caches subscribed to the table
+    # once the commit lands:
+    #
+    #     @changes.subscribe(Product, columns=('product_name', 'description'))
+    #     def _reindex(rows, bulk): ...
+    #
+    # rows maps the primary key of each flushed row that changed one of the
+    # columns (all of them by default) to their new values, or None if it was
+    # deleted. bulk is True when a bulk insert/update/delete may have changed
+    # them; a bulk statement that only sets some columns can say which with
+    # .execution_options(changed_columns=(...)).
+
+    def __init__(self):
+        self.subscribers = {}  # table name -> [(columns, callback)]
+
+    def subscribe(self, model, columns=None):
+        def register(callback):
+            self.subscribers.setdefault(model.__table__.name, []).append((columns, callback))
+            return callback
+        return register
+
+    def _watched(self, table):
+        # ORM statements carry an annotated copy of the table, so compare by name
+        return table is not None and table.name in self.subscribers
+
+    def record_flush(self, session):
+        # Still the pre-flush state here: new/dirty/deleted and attribute history
+        changed = session.info.setdefault('changes', {})
+        dirty, deleted = session.dirty, session.deleted
+        for obj in chain(session.new, dirty, deleted):
+            state = inspect(obj)
+            table = state.mapper.local_table
+            if not self._watched(table):
+                continue
+            keys = state.mapper.column_attrs.keys()
+            if obj in dirty:
+                keys = [key for key in keys if state.attrs[key].history.has_changes()]
+                if not keys:
+                    continue  # only relationships or no-op assignments
+            rows = changed.setdefault(table.name, {'rows': {}, 'bulk': set()})['rows']
+            row_id = state.mapper.primary_key_from_instance(obj)[0]  # every model has a single id
+            columns, _ = rows.get(row_id, (set(), None))
+            values = None if obj in deleted else {key: getattr(obj, key) for key in self._wanted(table.name)}
+            rows[row_id] = (columns | set(keys), values)
+
+    def record_bulk(self, orm_execute_state):
+        if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+            return
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if not self._watched(table):
+            return
+        columns = orm_execute_state.execution_options.get('changed_columns') if orm_execute_state.is_update else None
+        changed = orm_execute_state.session.info.setdefault('changes', {})
+        changed.setdefault(table.name, {'rows': {}, 'bulk': set()})['bulk'].update(columns or table.c.keys())
+
+    def _wanted(self, table_name):
+        return {key for columns, _ in self.subscribers[table_name] for key in columns or ()}
+
+    def notify(self, session):
+        for table_name, changed in session.info.pop('changes', {}).items():
+            for columns, callback in self.subscribers[table_name]:
+                wanted = set(columns) if columns is not None else None
+                rows = {row_id: values for row_id, (touched, values) in changed['rows'].items()
+                        if wanted is None or touched & wanted}
+                bulk = bool(changed['bulk'] if wanted is None else changed['bulk'] & wanted)
+                if rows or bulk:
+                    callback(rows, bulk)
+
+    def discard(self, session):
+        session.info.pop('changes', None)
+
+
+changes = ChangeTracker()
+
+
+@event.listens_for(Session, 'after_flush')
+def _record_flush(session, flush_context):
+    changes.record_flush(session)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _record_bulk(orm_execute_state):
+    changes.record_bulk(orm_execute_state)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify(session):
+    changes.notify(session)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard(session):
+    changes.discard(session)
@@ -0,0 +1,109 @@
+from collections import namedtuple
+from sqlalchemy import select, insert, update, delete, bindparam
+from sqlalchemy.exc import IntegrityError
+from .models import Cart, Order, Product, Checkout
+from .init import db
+from .reporting import record_orders
+from datetime import datetime, timedelta
+import json
+
+
+SESSION_LIFETIME = timedelta(days=1)  # Stripe's default Checkout Session expiry
+
+Line = namedtuple('Line', 'product_link quantity current_price_cents currency')
+
+
+class OutOfStock(Exception):
+    pass
+
+
+def save_checkout(customer_id, session_id, items):
+    # items: the cart rows the Checkout Session was created from
+    lines = [{'product_id': item.product_link, 'quantity': item.quantity,
+              'price_cents': item.product.current_price_cents, 'currency': item.product.currency}
+             for item in items]
+    db.session.add(Checkout(session_id=session_id, customer_link=customer_id, lines=json.dumps(lines)))
+    db.session.execute(delete(Checkout).where(Checkout.customer_link == customer_id,
+                                              Checkout.created_at < datetime.utcnow() - SESSION_LIFETIME)
+                       .execution_options(synchronize_session=False))  # expired, can no longer be paid
+    db.session.commit()
+
+
+def paid_lines(customer_id, session_id):
+    # What the Checkout Session charged for. Sessions created before snapshots
+    # were kept have none and fall back to the cart as it is now.
+    checkout = db.session.execute(select(Checkout.lines).where(
+        Checkout.session_id == session_id, Checkout.customer_link == customer_id)).scalar() if session_id else None
+    if checkout is not None:
+        return [Line(line['product_id'], line['quantity'], line['price_cents'], line['currency'])
+                for line in json.loads(checkout)]
+    return [Line(*row) for row in db.session.execute(
+        select(Cart.product_link, Cart.quantity, Product.current_price_cents, Product.currency)
+        .join(Product, Cart.product_link == Product.id)
+        .where(Cart.customer_link == customer_id))]
+
+
+def finalize_order(customer_id, payment_id, session_id=None, status='Paid'):
+    # Turns what the customer paid for into orders in one transaction: one
+    # conditional stock decrement, one INSERT of orders, then the paid quantities
+    # taken out of the cart (anything added since stays in it), plus the order
+    # header and report rows. Returns the number of order lines created;
+    # replaying an already finalized payment_id is a no-op that returns 0.
+    try:
+        if db.session.execute(select(Order.id).where(Order.payment_id == payment_id).limit(1)).first():
+            return 0
+
+        lines = paid_lines(customer_id, session_id)
+        if not lines:
+            return 0
+
+        _decrement_stock(lines)
+
+        created_at = datetime.utcnow()
+        rows = [{
+            'price_cents': line.current_price_cents * line.quantity,
+            'currency': line.currency,
+            'payment_id': payment_id,
+            'quantity': line.quantity,
+            'status': status,
+            'customer_link': customer_id,
+            'product_link': line.product_link,
+            'created_at': created_at,
+        } for line in lines]
+        db.session.execute(insert(Order), rows)
+        record_orders(customer_id, payment_id, rows, created_at)
+        _remove_from_cart(customer_id, lines)
+
+        db.session.commit()
+        return len(lines)
+    except IntegrityError:
+        db.session.rollback()  # the order header for this payment_id already exists
+        return 0
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def _remove_from_cart(customer_id, lines):
+    stmt = update(Cart.__table__) \
+        .where(Cart.customer_link == customer_id, Cart.product_link == bindparam('pid')) \
+        .values(quantity=Cart.quantity - bindparam('qty'))
+    db.session.execute(stmt, [{'pid': line.product_link, 'qty': line.quantity} for line in lines])
+    db.session.execute(delete(Cart).where(Cart.customer_link == customer_id, Cart.quantity <= 0)
+                       .execution_options(synchronize_session=False))
+
+
+def _decrement_stock(lines):
+    stmt = update(Product.__table__) \
+        .where(Product.id == bindparam('pid'), Product.in_stock >= bindparam('qty')) \
+        .values(in_stock=Product.in_stock - bindparam('qty')) \
+        .execution_options(changed_columns=('in_stock',))
+    params = [{'pid': line.product_link, 'qty': line.quantity} for line in lines]
+
+    if db.engine.dialect.supports_sane_multi_rowcount:
+        updated = db.session.execute(stmt, params).rowcount
+    else:
+        updated = sum(db.session.execute(stmt, p).rowcount for p in params)
+
+    if updated != len(lines):
+        raise OutOfStock('Some items in your cart are out of stock.')
@@ -0,0 +1,110 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+import os
+
+
+# Database settings per APP_ENV. Any of them can be overridden with an
+# environment variable of the same name.
+
+PROFILES = {
+    'development': {
+        'DB_POOL_SIZE': 5,
+        'DB_MAX_OVERFLOW': 10,
+        'DB_POOL_TIMEOUT': 30,
+        'DB_POOL_RECYCLE': -1,
+        'DB_STATEMENT_TIMEOUT_MS': 0,
+        'SQLITE_WAL': True,
+        'SQLITE_BUSY_TIMEOUT_MS': 5000,
+        'SQLITE_SYNCHRONOUS': 'NORMAL',
+        'DB_AUTO_MIGRATE': True,
+    },
+    'testing': {
+        'DB_POOL_SIZE': 2,
+        'DB_MAX_OVERFLOW': 2,
+        'DB_POOL_TIMEOUT': 5,
+        'DB_POOL_RECYCLE': -1,
+        'DB_STATEMENT_TIMEOUT_MS': 5000,
+        'SQLITE_WAL': False,  # throwaway databases; skip the -wal/-shm files
+        'SQLITE_BUSY_TIMEOUT_MS': 5000,
+        'SQLITE_SYNCHRONOUS': 'OFF',
+        'DB_AUTO_MIGRATE': True,
+    },
+    'production': {
+        'DB_POOL_SIZE': 10,
+        'DB_MAX_OVERFLOW': 20,
+        'DB_POOL_TIMEOUT': 10,
+        'DB_POOL_RECYCLE': 1800,  # below typical server/proxy idle timeouts
+        'DB_STATEMENT_TIMEOUT_MS': 30000,
+        'SQLITE_WAL': True,
+        'SQLITE_BUSY_TIMEOUT_MS': 10000,
+        'SQLITE_SYNCHRONOUS': 'NORMAL',
+        'DB_AUTO_MIGRATE': False,  # deploys run `flask upgrade-db` once instead of every worker at boot
+    },
+}
+
+
+def load_profile(app):
+    name = os.getenv("APP_ENV", "development")
+    if name not in PROFILES:
+        raise ValueError(f'APP_ENV must be one of {", ".join(PROFILES)}, not {name!r}')
+    app.config['APP_ENV'] = name
+    app.config['TESTING'] = name == 'testing'
+    for key, default in PROFILES[name].items():
+        value = os.getenv(key)
+        if value is None:
+            app.config[key] = default
+        elif isinstance(default, bool):
+            app.config[key] = value == '1'
+        else:
+            app.config[key] = type(default)(value)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+
+
+def engine_options(config):
+    from .metrics import TimedQueuePool
+
+    uri = config.get('SQLALCHEMY_DATABASE_URI')
+    if not uri:
+        return {}
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            return {}  # one shared connection, nothing to pool
+        return {
+            'poolclass': TimedQueuePool,
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'connect_args': {'timeout': config['SQLITE_BUSY_TIMEOUT_MS'] / 1000},
+        }
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+    }
+    timeout = config['DB_STATEMENT_TIMEOUT_MS']
+    if timeout and url.get_backend_name() == 'postgresql':
+        options['connect_args'] = {'options': f'-c statement_timeout={timeout}'}
+    elif timeout and url.get_backend_name() == 'mysql':
+        options['connect_args'] = {'init_command': f'SET SESSION max_execution_time={timeout}'}
+    return options
+
+
+def configure_engine(engine, config):
+    if engine.dialect.name != 'sqlite':
+        return
+    if config['SQLITE_SYNCHRONOUS'] not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be OFF, NORMAL, FULL or EXTRA, not {config['SQLITE_SYNCHRONOUS']!r}")
+
+    @event.listens_for(engine, 'connect')
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if config['SQLITE_WAL'] and engine.url.database not in (None, '', ':memory:'):
+            cursor.execute('PRAGMA journal_mode=WAL')  # readers no longer block the writer
+        cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+        cursor.execute(f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}")
+        cursor.close()
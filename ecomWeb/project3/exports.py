@@ -0,0 +1,43 @@
+from sqlalchemy import select
+from .models import Product, Order, Customer
+from .init import db
+import csv
+import io
+import json
+
+
+# Columns written for each admin export; Customer.password is deliberately left out
+EXPORTS = {
+    'products': (Product, ['id', 'product_name', 'description', 'current_price_cents', 'previous_price_cents',
+                           'currency', 'product_picture', 'in_stock', 'flash_sale', 'date_added']),
+    'orders': (Order, ['id', 'payment_id', 'customer_link', 'product_link', 'price_cents', 'currency',
+                         'quantity', 'status']),
+    'customers': (Customer, ['id', 'username', 'email', 'date_joined']),
+}
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+YIELD_PER = 1000
+
+
+def export_rows(kind, fmt='csv'):
+    model, columns = EXPORTS[kind]
+    stmt = select(*[getattr(model, name) for name in columns]).order_by(model.id)
+
+    # yield_per keeps a server-side cursor open and only buffers one batch at a time
+    result = db.session.execute(stmt.execution_options(yield_per=YIELD_PER))
+
+    if fmt == 'jsonl':
+        for row in result:
+            yield json.dumps(dict(zip(columns, row)), default=str) + '\n'
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in result:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    yield buffer.getvalue()
@@ -0,0 +1,61 @@
+from flask import Flask, request, jsonify
+import itertools
+import os
+import time
+
+
+# A tiny stand-in for the Stripe API covering the calls the shop makes. Point
+# the app at it with STRIPE_API_BASE=http://127.0.0.1:12111 and set
+# FAKE_STRIPE_DELAY (seconds) to simulate a slow provider.
+
+def create_fake_stripe(delay=0.0):
+    app = Flask(__name__)
+    sessions = {}
+    refunds = []  # payment intent ids, in order
+    ids = itertools.count(1)
+
+    @app.before_request
+    def slow_provider():
+        if delay:
+            time.sleep(delay)
+
+    @app.route('/v1/checkout/sessions', methods=['POST'])
+    def create_session():
+        number = next(ids)
+        session_id = f'cs_test_{number}'
+        success_url = request.form.get('success_url', '')
+        sessions[session_id] = {
+            'id': session_id,
+            'object': 'checkout.session',
+            'payment_intent': f'pi_test_{number}',
+            'payment_status': 'paid',
+            'client_reference_id': request.form.get('client_reference_id'),
+            # Skips the hosted payment page and goes straight back to the shop
+            'url': success_url.replace('{CHECKOUT_SESSION_ID}', session_id),
+        }
+        return jsonify(sessions[session_id])
+
+    @app.route('/v1/checkout/sessions/<session_id>')
+    def retrieve_session(session_id):
+        if session_id not in sessions:
+            return jsonify({'error': {'type': 'invalid_request_error', 'message': 'No such checkout.session'}}), 404
+        return jsonify(sessions[session_id])
+
+    @app.route('/v1/payment_intents/<intent_id>')
+    def retrieve_payment_intent(intent_id):
+        return jsonify({'id': intent_id, 'object': 'payment_intent', 'status': 'succeeded'})
+
+    @app.route('/v1/refunds', methods=['POST'])
+    def create_refund():
+        intent_id = request.form.get('payment_intent')
+        refunds.append(intent_id)
+        return jsonify({'id': f're_test_{len(refunds)}', 'object': 'refund', 'payment_intent': intent_id,
+                        'status': 'succeeded'})
+
+    app.refunds = refunds
+
+    return app
+
+
+if __name__ == '__main__':
+    create_fake_stripe(float(os.getenv('FAKE_STRIPE_DELAY', 0))).run(port=12111, threaded=True)
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, BooleanField, PasswordField, SubmitField, EmailField, IntegerField, FloatField, SelectField
+from wtforms import StringField, BooleanField, PasswordField, SubmitField, EmailField, IntegerField, DecimalField, SelectField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, NumberRange
 from flask_wtf.file import FileField, FileRequired
 
@@ -28,8 +28,8 @@ class ChangePassword(FlaskForm):
 
 class ShopItems(FlaskForm):
      product_name = StringField('Product Name', validators=[DataRequired()])
-     current_price = FloatField('Current_Price', validators=[DataRequired()])
-     previous_price = FloatField('previous_price', validators=[DataRequired()])
+     current_price = DecimalField('Current_Price', places=2, validators=[DataRequired()])
+     previous_price = DecimalField('previous_price', places=2, validators=[DataRequired()])
      in_stock = IntegerField('In Stock', validators=[DataRequired()])
      product_picture = FileField('Product picture', validators=[FileRequired()])
      flash_sale = BooleanField('sale')
@@ -38,6 +38,11 @@ class ShopItems(FlaskForm):
      update_product = SubmitField('Update Product')
 
 
+class ImportProducts(FlaskForm):
+     products_file = FileField('CSV or JSON lines file', validators=[FileRequired()])
+     import_products = SubmitField('Import')
+
+
 class OrdersForm(FlaskForm):
     order_status = SelectField('Order Status',choices=[("Pending", "Pending"), ("Accepted", "Accepted"),
                                                                                  ("Out for delivery", "Out for delivery"),
@@ -0,0 +1,112 @@
+from functools import wraps
+from flask import request, make_response
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from .models import Order, Customer, Product
+from .caches import LRUCache, RedisCache
+from . import catalog  # its change subscriber must run before the ones below
+from .changes import changes
+from .replicas import on_primary
+import time
+
+
+class FragmentCache:
+    # Rendered template fragments, keyed by the fragment's name, the version of
+    # the data it shows and whatever else the template passes in:
+    #
+    #     {% cache 'home-items', cache_version('catalog') %} ... {% endcache %}
+
+    def __init__(self):
+        self.backend = LRUCache(maxsize=1000, ttl=300)
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def init_app(self, app):
+        ttl = app.config.get('FRAGMENT_CACHE_TTL', 300)
+        url = app.config.get('FRAGMENT_CACHE_URL')
+        if url and not app.config.get('CATALOG_CACHE_URL'):
+            # Each worker would clear only its own catalog cache, so another could
+            # render the new catalog version from stale rows and share the result
+            raise ValueError('Set CATALOG_CACHE_URL as well as FRAGMENT_CACHE_URL, so shared fragments '
+                             'are rendered from a catalog cache shared by all workers')
+        if not url:
+            # Versions are then per process too, and miss other workers' changes:
+            # fragments shouldn't stay stale longer than the catalog entries do
+            ttl = min(ttl, app.config.get('CATALOG_CACHE_TTL', 60))
+        self.backend = RedisCache(url, ttl=ttl, prefix='fragment:') if url else LRUCache(maxsize=1000, ttl=ttl)
+        app.jinja_env.add_extension(FragmentCacheExtension)
+        app.jinja_env.globals['cache_version'] = self.version
+
+    def version(self, name):
+        # Kept in the fragment backend, so shared fragments have shared versions
+        return self.backend.counter(name)
+
+    def bump(self, name):
+        self.backend.incr(name)
+
+    def render(self, key, render):
+        entry = self.backend.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.seconds_saved += entry['seconds']
+            return entry['html']
+        self.misses += 1
+        start = time.perf_counter()
+        with on_primary():
+            html = render()
+        self.backend.set(key, {'html': str(html), 'seconds': time.perf_counter() - start})
+        return html
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'seconds_saved': round(self.seconds_saved, 6)}
+
+
+fragment_cache = FragmentCache()
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(parts)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        key = ':'.join(str(part) for part in parts)
+        return Markup(fragment_cache.render(key, caller))
+
+
+def conditional(view):
+    # ETag from the rendered body; a matching If-None-Match gets a 304 without the body
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        if request.method == 'GET' and response.status_code == 200 and not response.is_streamed:
+            response.cache_control.private = True
+            response.cache_control.no_cache = True  # always revalidate, usually for a 304
+            response.add_etag()
+            response.make_conditional(request)
+        return response
+    return wrapper
+
+
+# Catalog changes make the product listings stale; catalog.py, imported above,
+# has already cleared its cache by the time the version moves on
+
+@changes.subscribe(Product)
+def _bump_catalog_version(rows, bulk):
+    fragment_cache.bump('catalog')
+
+
+# Order (and customer name/email) changes make the admin orders table stale
+
+@changes.subscribe(Order)
+@changes.subscribe(Customer, columns=('username', 'email'))
+def _bump_orders_version(rows, bulk):
+    fragment_cache.bump('orders')
@@ -0,0 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+from werkzeug.utils import secure_filename
+from threading import get_ident
+import hashlib
+import os
+
+
+@lru_cache(maxsize=None)
+def pillow():
+    # Imported when the first picture needs resizing rather than at startup
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # Pillow missing: originals are still stored, just not resized
+        return None
+    return Image, ImageOps
+
+
+# Longest edge in pixels for each rendition the templates ask for
+RENDITIONS = {'thumb': 150, 'card': 400, 'full': 1200}
+
+MEDIA_URL = '/static/media/'
+
+
+class ImagePipeline:
+    def __init__(self):
+        self.media_dir = None
+        self.executor = None
+        self._ready = set()
+
+    def init_app(self, app):
+        self.media_dir = os.path.join(app.root_path, 'static', 'media')
+        self.executor = ThreadPoolExecutor(max_workers=app.config.get('IMAGE_WORKERS', 2),
+                                           thread_name_prefix='images')
+        app.add_template_filter(self.rendition, 'rendition')
+
+    def save_upload(self, file):
+        return self.save(file.read(), file.filename)
+
+    def save(self, data, filename, background=True):
+        # Stores the picture under a content hash, so re-uploading the same picture
+        # reuses the existing files, and makes the resized renditions (queued, or
+        # right here when the caller is already a worker thread, as bulk imports are).
+        digest = hashlib.sha256(data).hexdigest()[:20]
+        ext = os.path.splitext(secure_filename(filename))[1].lower() or '.img'
+        name = digest + ext
+
+        path = os.path.join(self.media_dir, name)
+        if not os.path.exists(path):
+            self._write(path, data)
+        missing = [r for r in RENDITIONS if not os.path.exists(os.path.join(self.media_dir, f'{digest}-{r}.webp'))]
+        if missing and pillow() is not None:
+            if background:
+                self.executor.submit(self._make_renditions, digest, data)
+            else:
+                self._make_renditions(digest, data)
+        return MEDIA_URL + name
+
+    def _make_renditions(self, digest, data):
+        Image, ImageOps = pillow()
+        try:
+            with Image.open(BytesIO(data)) as original:
+                image = ImageOps.exif_transpose(original)
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA')
+                for rendition, size in RENDITIONS.items():
+                    path = os.path.join(self.media_dir, f'{digest}-{rendition}.webp')
+                    if os.path.exists(path):
+                        continue
+                    resized = image.copy()
+                    resized.thumbnail((size, size))
+                    buffer = BytesIO()
+                    resized.save(buffer, 'WEBP', quality=80, method=4)
+                    self._write(path, buffer.getvalue())
+        except Exception as e:
+            print('Error processing image', digest, e)
+
+    def _write(self, path, data):
+        # Write then rename, so a half-written file is never served. Pool threads
+        # may be saving the same picture, so the temporary name is per thread.
+        tmp = f'{path}.{os.getpid()}.{get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def rendition(self, url, rendition):
+        # Template filter: the WebP rendition once it exists, otherwise the original
+        if not url or not url.startswith(MEDIA_URL):
+            return url
+        digest = os.path.splitext(url[len(MEDIA_URL):])[0]
+        name = f'{digest}-{rendition}.webp'
+        if name not in self._ready:
+            if not os.path.exists(os.path.join(self.media_dir, name)):
+                return url
+            self._ready.add(name)
+        return MEDIA_URL + name
+
+
+images = ImagePipeline()
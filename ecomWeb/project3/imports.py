@@ -0,0 +1,316 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import InvalidOperation
+from urllib.parse import urlparse
+from urllib.request import urlopen
+from flask.cli import AppGroup
+from sqlalchemy import select, insert, update, func
+from .models import Product
+from .init import db
+from .money import to_cents, CURRENCY
+from .images import images, MEDIA_URL
+from .exports import export_rows, EXPORT_FORMATS
+from contextlib import nullcontext
+import click
+import csv
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+
+# Bulk product import, the counterpart of export_rows('products'): CSV or JSON
+# lines with the same columns (prices may also be given as current_price /
+# previous_price in units). The file is read, validated and written one chunk at
+# a time, with one executemany and one commit per chunk, so memory stays flat
+# however large the catalog. Rows with an id replace that product (or create it
+# with that id, so an export round-trips); rows without one are new products.
+
+CHUNK_SIZE = 1000
+IMAGE_WORKERS = 8
+FETCH_TIMEOUT = 10
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+MAX_ERRORS = 100  # reported in full; the rest are only counted
+
+TRUE = {'1', 'true', 'yes', 'y', 'on'}
+
+
+class RowError(ValueError):
+    pass
+
+
+def guess_format(filename):
+    return 'jsonl' if os.path.splitext(filename or '')[1].lower() in ('.jsonl', '.ndjson') else 'csv'
+
+
+def read_rows(stream, fmt):
+    # (line number, row) from a text stream; row is None for unparseable JSON
+    if fmt == 'jsonl':
+        for number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield number, json.loads(line)
+                except ValueError:
+                    yield number, None
+        return
+
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _text(value):
+    return str(value).strip() if value is not None else ''
+
+
+def _cents(row, name):
+    if _text(row.get(f'{name}_cents')):
+        cents = int(_text(row[f'{name}_cents']))
+    elif _text(row.get(name)):
+        try:
+            cents = to_cents(_text(row[name]))
+        except InvalidOperation:
+            raise RowError(f'{name} {row[name]!r} is not a number')
+    else:
+        return None
+    if cents < 0:
+        raise RowError(f'{name} is negative')
+    return cents
+
+
+def clean_row(row):
+    if not isinstance(row, dict):
+        raise RowError('not a valid JSON object')
+    try:
+        name = _text(row.get('product_name'))
+        if not name:
+            raise RowError('product_name is required')
+        if len(name) > 100:
+            raise RowError('product_name is longer than 100 characters')
+        description = _text(row.get('description')) or None
+        if description and len(description) > 500:
+            raise RowError('description is longer than 500 characters')
+
+        current = _cents(row, 'current_price')
+        if current is None:
+            raise RowError('current_price is required')
+        previous = _cents(row, 'previous_price')
+        currency = (_text(row.get('currency')) or CURRENCY).lower()
+        if len(currency) != 3:
+            raise RowError(f'unknown currency {currency!r}')
+        in_stock = int(_text(row.get('in_stock')) or 0)
+        if in_stock < 0:
+            raise RowError('in_stock is negative')
+
+        flash_sale = row.get('flash_sale')
+        cleaned = {
+            'id': int(_text(row.get('id'))) if _text(row.get('id')) else None,
+            'product_name': name,
+            'description': description,
+            'current_price_cents': current,
+            'previous_price_cents': current if previous is None else previous,
+            'currency': currency,
+            'product_picture': _text(row.get('product_picture')) or None,
+            'in_stock': in_stock,
+            'flash_sale': flash_sale if isinstance(flash_sale, bool) else _text(flash_sale).lower() in TRUE,
+        }
+        if _text(row.get('date_added')):
+            cleaned['date_added'] = datetime.fromisoformat(_text(row['date_added']))
+        return cleaned
+    except (ArithmeticError, ValueError, TypeError) as e:
+        if isinstance(e, RowError):
+            raise
+        raise RowError(str(e))
+
+
+class PictureFetcher:
+    # Turns the picture column into stored media: URLs are downloaded, local paths
+    # (CLI imports only) are read relative to the import file, and both are resized
+    # on a thread pool. Each distinct source is fetched once per import.
+
+    def __init__(self, base_dir=None, workers=IMAGE_WORKERS):
+        self.base_dir = base_dir
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import-images')
+        self.resolved = {}  # source -> media URL, or the exception it failed with
+        self.fetched = 0
+
+    def is_stored(self, source):
+        return source.startswith((MEDIA_URL, '/static/'))
+
+    def resolve(self, rows):
+        sources = {row['product_picture'] for row in rows if row['product_picture']}
+        todo = [s for s in sources if not self.is_stored(s) and s not in self.resolved]
+        for source, result in zip(todo, self.executor.map(self._fetch, todo)):
+            self.resolved[source] = result
+            self.fetched += not isinstance(result, Exception)
+
+        errors = []
+        for row in rows:
+            source = row['product_picture']
+            if not source or self.is_stored(source):
+                continue
+            result = self.resolved[source]
+            if isinstance(result, Exception):
+                del row['product_picture']  # an updated product keeps its picture; a new one has none
+                errors.append((row['_line'], f'picture not imported: {result}'))
+            else:
+                row['product_picture'] = result
+        return errors
+
+    def _fetch(self, source):
+        try:
+            if urlparse(source).scheme in ('http', 'https'):
+                with urlopen(source, timeout=FETCH_TIMEOUT) as response:
+                    data = response.read(MAX_IMAGE_BYTES + 1)
+                filename = os.path.basename(urlparse(source).path)
+            elif self.base_dir is not None:
+                with open(os.path.join(self.base_dir, source), 'rb') as f:
+                    data = f.read(MAX_IMAGE_BYTES + 1)
+                filename = os.path.basename(source)
+            else:
+                raise ValueError(f'{source!r} is not an http(s) URL')
+            if len(data) > MAX_IMAGE_BYTES:
+                raise ValueError(f'{source!r} is larger than {MAX_IMAGE_BYTES} bytes')
+            return images.save(data, filename, background=False)  # already on a worker thread
+        except Exception as e:
+            return e
+
+    def close(self):
+        self.executor.shutdown()
+
+
+def write_chunk(rows):
+    # One executemany per kind of write; returns (inserted, updated)
+    ids = [row['id'] for row in rows if row['id'] is not None]
+    existing = set(db.session.scalars(select(Product.id).where(Product.id.in_(ids)))) if ids else set()
+
+    now = datetime.utcnow()
+    inserts, updates = [], []
+    for row in rows:
+        row = {key: value for key, value in row.items() if key != '_line'}
+        if row['id'] in existing:
+            updates.append(row)
+        else:
+            if row['id'] is None:
+                del row['id']
+            else:
+                existing.add(row['id'])  # a repeat later in the chunk updates it
+            row.setdefault('date_added', now)
+            inserts.append(row)
+
+    if inserts:
+        db.session.execute(insert(Product), inserts)
+        if db.engine.dialect.name == 'postgresql' and any('id' in row for row in inserts):
+            # Explicit ids don't advance the id sequence, so the next product added
+            # without one would collide with them
+            db.session.execute(select(func.setval(func.pg_get_serial_sequence(Product.__tablename__, 'id'),
+                                                  select(func.max(Product.id)).scalar_subquery())))
+    if updates:
+        db.session.execute(update(Product), updates)  # bulk UPDATE by primary key
+    db.session.commit()
+    return len(inserts), len(updates)
+
+
+def import_products(stream, fmt='csv', base_dir=None, chunk_size=CHUNK_SIZE):
+    # Yields the running totals after every chunk; the last one is the summary
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'pictures': 0,
+             'error_count': 0, 'errors': [], 'seconds': 0.0, 'rows_per_second': 0}
+    start = time.perf_counter()
+    pictures = PictureFetcher(base_dir)
+
+    def error(line, message):
+        stats['error_count'] += 1
+        if len(stats['errors']) < MAX_ERRORS:
+            stats['errors'].append({'line': line, 'error': message})
+
+    def flush(chunk):
+        for line, message in pictures.resolve(chunk):
+            error(line, message)
+        try:
+            inserted, updated = write_chunk(chunk)
+            stats['inserted'] += inserted
+            stats['updated'] += updated
+        except Exception as e:
+            db.session.rollback()
+            print(e)
+            stats['skipped'] += len(chunk)
+            error(chunk[0]['_line'], f'lines {chunk[0]["_line"]}-{chunk[-1]["_line"]} not imported: {e}')
+        stats['pictures'] = pictures.fetched
+        stats['seconds'] = round(time.perf_counter() - start, 3)
+        stats['rows_per_second'] = round(stats['rows'] / stats['seconds']) if stats['seconds'] else 0
+        return dict(stats, errors=list(stats['errors']))
+
+    try:
+        chunk, flushed = [], False
+        for line, row in read_rows(stream, fmt):
+            stats['rows'] += 1
+            try:
+                cleaned = clean_row(row)
+            except RowError as e:
+                stats['skipped'] += 1
+                error(line, str(e))
+                continue
+            cleaned['_line'] = line
+            chunk.append(cleaned)
+            if len(chunk) >= chunk_size:
+                yield flush(chunk)
+                chunk, flushed = [], True
+        if chunk or not flushed:
+            yield flush(chunk)
+    finally:
+        pictures.close()
+
+
+def progress_line(stats):
+    return (f"{stats['rows']} rows: {stats['inserted']} inserted, {stats['updated']} updated, "
+            f"{stats['skipped']} skipped, {stats['pictures']} pictures, {stats['rows_per_second']} rows/s")
+
+
+def open_path(path, mode='r'):
+    # newline='' as the csv module wants; '-' is stdin/stdout
+    if path == '-':
+        return nullcontext(sys.stdin if mode == 'r' else sys.stdout)
+    return open(path, mode, encoding='utf-8-sig' if mode == 'r' else 'utf-8', newline='')
+
+
+cli = AppGroup('catalog', help='Bulk product import and export.')
+
+
+@cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), help='default: from the file extension')
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True)
+def import_command(path, fmt, chunk_size):
+    """Import products from a CSV or JSON-lines file ('-' for stdin)."""
+    fmt = fmt or guess_format(path)
+    base_dir = os.getcwd() if path == '-' else os.path.dirname(os.path.abspath(path))
+    with open_path(path) as stream:
+        for stats in import_products(stream, fmt, base_dir, chunk_size):
+            click.echo(progress_line(stats), err=True)
+    for entry in stats['errors']:
+        click.echo(f"line {entry['line']}: {entry['error']}", err=True)
+    if stats['error_count'] > len(stats['errors']):
+        click.echo(f"... and {stats['error_count'] - len(stats['errors'])} more errors", err=True)
+
+
+@cli.command('export')
+@click.argument('path', default='-', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), help='default: from the file extension')
+def export_command(path, fmt):
+    """Export all products as CSV or JSON lines ('-' for stdout)."""
+    fmt = fmt or guess_format(path)
+    with open_path(path, 'w') as out:
+        for chunk in export_rows('products', fmt):
+            out.write(chunk)
+
+
+def upload_stream(file):
+    # Request files are closed when the view returns, before a streamed response
+    # runs, so the import reads its own spooled copy
+    copy = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE * 1024)
+    shutil.copyfileobj(file.stream, copy)
+    copy.seek(0)
+    return io.TextIOWrapper(copy, encoding='utf-8-sig', newline='')
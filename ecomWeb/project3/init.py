@@ -2,15 +2,17 @@ from flask_bcrypt import Bcrypt  # Only import from flask_bcrypt
 from flask import Flask, render_template
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-import stripe  # Import stripe for payment processing
+import gc
 import os
 from dotenv import load_dotenv
+from .config import load_profile, configure_engine
+from .replicas import RoutingSession
 
 
 
 
 
-db = SQLAlchemy()  
+db = SQLAlchemy(session_options={'class_': RoutingSession})  
 bcrypt = Bcrypt()  
 
 def create_app():
@@ -21,11 +23,37 @@ def create_app():
     app.config['SECRET_KEY'] = os.getenv("SECRET_KEY")
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("SQLALCHEMY_DATABASE_URI")
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    replicas = [url for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url]
+    app.config['SQLALCHEMY_BINDS'] = {f'replica_{i}': url for i, url in enumerate(replicas)}
+    app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv("REPLICA_STICKY_SECONDS", 5))  # covers replication lag
+    load_profile(app)  # APP_ENV=development|testing|production; sets SQLALCHEMY_ENGINE_OPTIONS
+    app.config['CATALOG_CACHE_TTL'] = int(os.getenv("CATALOG_CACHE_TTL", 60))
+    app.config['CATALOG_CACHE_URL'] = os.getenv("CATALOG_CACHE_URL")  # optional redis:// backend
+    app.config['FRAGMENT_CACHE_TTL'] = int(os.getenv("FRAGMENT_CACHE_TTL", 300))
+    app.config['FRAGMENT_CACHE_URL'] = os.getenv("FRAGMENT_CACHE_URL")  # optional redis:// backend
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv("BCRYPT_LOG_ROUNDS", 12))
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv("PASSWORD_HASH_WORKERS", 0))  # 0 hashes on the request thread
+    app.config['ADMIN_IDS'] = [int(i) for i in os.getenv("ADMIN_IDS", "1").split(",")]
+    app.config['PRINCIPAL_CACHE_TTL'] = int(os.getenv("PRINCIPAL_CACHE_TTL", 300))
+    app.config['PRINCIPAL_CACHE_URL'] = os.getenv("PRINCIPAL_CACHE_URL")  # optional redis:// backend
     bcrypt.init_app(app) # Initialize Bcrypt with the Flask app
     app.config['STRIPE_PUBLIC_KEY'] = ("STRIPE_PUBLIC_KEY")
-    stripe.api_key = os.getenv("STRIPE_API_KEY")
+    app.config['STRIPE_API_KEY'] = os.getenv("STRIPE_API_KEY")
+    app.config['STRIPE_API_BASE'] = os.getenv("STRIPE_API_BASE")  # point at fake_stripe for local runs
+    app.config['PAYMENT_CONFIRM_ASYNC'] = os.getenv("PAYMENT_CONFIRM_ASYNC") == "1"
+    app.config['STRIPE_WEBHOOK_SECRET'] = os.getenv("STRIPE_WEBHOOK_SECRET")  # enables webhook order confirmation
+    app.config['JOB_WORKERS'] = int(os.getenv("JOB_WORKERS", 0))  # in-process workers; or run `flask work-jobs`
+    app.config['JOB_VISIBILITY_TIMEOUT'] = int(os.getenv("JOB_VISIBILITY_TIMEOUT", 300))  # seconds before a running job is retried
+    app.config['METRICS_TOKEN'] = os.getenv("METRICS_TOKEN")  # bearer token Prometheus scrapes /metrics with
+    app.config['PROFILE_SLOW_REQUESTS'] = os.getenv("PROFILE_SLOW_REQUESTS")  # seconds; dumps stacks of slower requests
+    app.config['RATE_LIMIT_ENABLED'] = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+    app.config['RATE_LIMIT_URL'] = os.getenv("RATE_LIMIT_URL")  # redis:// shared by all workers; required in production
+    app.config['PRELOAD'] = os.getenv("PRELOAD") == "1"  # set by gunicorn.conf.py; threads start in after_fork
     
     db.init_app(app) 
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(engine, app.config)
 
     @app.errorhandler(404)
     def page_not_found(error):
@@ -35,22 +63,101 @@ def create_app():
     login_manager = LoginManager()
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login' 
-    @login_manager.user_loader
-    def load_user(id):
-        return Customer.query.get(int(id))
 
 
     from .views import views
     from .authen import auth
     from .admin import admin 
     from .models import Customer, Product, Cart, Order
+    from .catalog import catalog_cache
+    from .payments import gateway
+    from .jobs import job_queue
+    from .images import images
+    from .assets import assets
+    from .search import search_index
+    from .metrics import metrics
+    from .passwords import hasher
+    from .principals import principals
+    from .replicas import router
+    from .fragments import fragment_cache
+    from .money import format_cents
+    from .ratelimit import limiter
+    from .imports import cli as catalog_cli
+
+    metrics.init_app(app)
+    hasher.init_app(app)
+    limiter.init_app(app)
+    principals.init_app(app, login_manager)  # user_loader served from cache
+    router.init_app(app)
+    catalog_cache.init_app(app)
+    fragment_cache.init_app(app)
+    app.add_template_filter(format_cents, 'money')
+    gateway.init_app(app)
+    images.init_app(app)
+    assets.init_app(app)
+    search_index.init_app(app)
 
     app.register_blueprint(views, url_prefix='/')
     app.register_blueprint(auth, url_prefix='/auth')
     app.register_blueprint(admin, url_prefix='/admin')
 
-    with app.app_context():
-        db.create_all()
+    if app.config['DB_AUTO_MIGRATE']:
+        with app.app_context():
+            from .migrations import upgrade
+            upgrade()
+
+    job_queue.init_app(app)  # after the job table exists
+
+    @app.cli.command('upgrade-db')
+    def upgrade_db():
+        from .migrations import upgrade
+        upgrade()
+
+    @app.cli.command('work-jobs')
+    def work_jobs():
+        job_queue.work()
+
+    @app.cli.command('rebuild-reports')
+    def rebuild_reports():
+        from .reporting import rebuild
+        with db.engine.begin() as conn:
+            rebuild(conn)
+
+    app.cli.add_command(catalog_cli)  # flask catalog import|export
 
+    @app.cli.command('sync-replicas')
+    def sync_replicas():
+        router.sync_sqlite(db.engines)  # SQLite replicas for local runs
 
     return app
+
+
+def warm_up(app):
+    # Runs in a preloading server's master just before it forks: whatever is
+    # loaded here is shared copy-on-write by every worker instead of loaded by each
+    from .payments import gateway
+    from .images import pillow
+    from .search import search_index
+
+    with app.app_context():
+        gateway.stripe
+        pillow()
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
+        try:
+            search_index.rebuild()  # so no request waits for the first build
+        except Exception as e:
+            print('Search index build failed', e)
+        for engine in db.engines.values():
+            engine.dispose()  # connections must not be shared across the fork
+    gc.collect()
+    gc.freeze()  # keeps the collector from writing to, and so copying, the shared pages
+
+
+def after_fork(app):
+    from .jobs import job_queue
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)  # drop any pool state inherited from the master
+    job_queue.start()
@@ -0,0 +1,166 @@
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from sqlalchemy import select, update, func, or_, and_
+from .models import Job
+from .checkout import OutOfStock
+from .payments import gateway
+from .init import db
+import json
+
+
+MAX_ATTEMPTS = 3
+POLL_INTERVAL = 0.5
+
+HANDLERS = {}
+
+
+def handler(kind):
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, payload):
+    # The job is committed before the caller responds, so it survives a restart
+    job = Job(kind=kind, payload=json.dumps(payload))
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+class JobQueue:
+    def __init__(self):
+        self.app = None
+        self.threads = []
+        self.stopping = Event()
+        self._lock = Lock()
+        self.processed = 0
+        self.failed = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+
+    def init_app(self, app):
+        self.app = app
+        if not app.config.get('PRELOAD'):
+            self.start()
+
+    def start(self):
+        # Threads don't survive fork(), so a preloading server calls this in each worker
+        self.threads = [thread for thread in self.threads if thread.is_alive()]
+        for number in range(len(self.threads), self.app.config.get('JOB_WORKERS', 0)):
+            thread = Thread(target=self.work, name=f'jobs-{number}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _stale_before(self):
+        return datetime.utcnow() - timedelta(seconds=self.app.config.get('JOB_VISIBILITY_TIMEOUT', 300))
+
+    def claim(self):
+        # Several workers may race for the same row; only the one whose UPDATE
+        # still sees it claimable gets it. A job left running longer than the
+        # visibility timeout belonged to a worker that died (or was killed by a
+        # deploy) mid-job and is claimed again, or failed if that was its last
+        # attempt; handlers must be idempotent, as finalize_order and refunds are
+        # per payment.
+        while True:
+            timed_out = and_(Job.status == 'running', Job.started_at < self._stale_before())
+            job = db.session.execute(select(Job.id, Job.status, Job.attempts)
+                                     .where(or_(Job.status == 'pending', timed_out))
+                                     .order_by(Job.id).limit(1)).first()
+            if job is None:
+                return None
+            if job.status == 'running' and job.attempts >= MAX_ATTEMPTS:
+                self._fail_timed_out(job.id, timed_out)
+                continue
+
+            job_id = job.id
+            claimable = or_(Job.status == 'pending', and_(timed_out, Job.attempts < MAX_ATTEMPTS))
+            claimed = db.session.execute(
+                update(Job).where(Job.id == job_id, claimable)
+                .values(status='running', started_at=datetime.utcnow(), attempts=Job.attempts + 1)
+                .execution_options(synchronize_session=False)).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id)
+
+    def _fail_timed_out(self, job_id, timed_out):
+        # The same rule as a handler raising on its last attempt in run_once
+        failed = db.session.execute(
+            update(Job).where(Job.id == job_id, timed_out, Job.attempts >= MAX_ATTEMPTS)
+            .values(status='failed', error='worker stopped during the last attempt', finished_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)).rowcount
+        db.session.commit()
+        if failed:
+            with self._lock:
+                self.failed += 1
+
+    def run_once(self):
+        job = self.claim()
+        if job is None:
+            return False
+
+        try:
+            HANDLERS[job.kind](json.loads(job.payload))
+            job.status = 'done'
+            job.error = None
+        except Exception as e:
+            print('Job failed', job.id, e)
+            db.session.rollback()
+            job = db.session.get(Job, job.id)
+            job.status = 'pending' if job.attempts < MAX_ATTEMPTS else 'failed'
+            job.error = str(e)[:500]
+
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        self._record(job)
+        return True
+
+    def _record(self, job):
+        latency = (job.finished_at - job.created_at).total_seconds()
+        with self._lock:
+            if job.status == 'done':
+                self.processed += 1
+                self.total_latency += latency
+                self.last_latency = latency
+            elif job.status == 'failed':
+                self.failed += 1
+
+    def work(self):
+        while not self.stopping.is_set():
+            with self.app.app_context():
+                try:
+                    busy = self.run_once()
+                except Exception as e:
+                    print('Job worker error', e)
+                    busy = False
+            if not busy:
+                self.stopping.wait(POLL_INTERVAL)
+
+    def stats(self):
+        depth = dict(db.session.execute(select(Job.status, func.count(Job.id))
+                                        .where(Job.status.in_(['pending', 'running']))
+                                        .group_by(Job.status)).all())
+        stuck = db.session.execute(select(func.count(Job.id)).where(Job.status == 'running',
+                                                                    Job.started_at < self._stale_before())).scalar()
+        with self._lock:
+            return {
+                'pending': depth.get('pending', 0),
+                'running': depth.get('running', 0),
+                'stuck': stuck,  # running past the visibility timeout, until the next claim retries or fails them
+                'processed': self.processed,
+                'failed': self.failed,
+                'avg_latency': self.total_latency / self.processed if self.processed else 0.0,
+                'last_latency': self.last_latency,
+            }
+
+
+job_queue = JobQueue()
+
+
+@handler('confirm_checkout')
+def confirm_checkout(payload):
+    try:
+        gateway.finalize_or_refund(payload['customer_id'], payload['payment_id'], payload.get('session_id'))
+    except OutOfStock:
+        pass  # refunded; retrying can't help
@@ -0,0 +1,270 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from threading import Lock, Thread, get_ident
+from flask import g, request, has_request_context, before_render_template, template_rendered, Response, current_app
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+import hmac
+import os
+import sys
+import time
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_bucket{{{labels},le="+Inf"}} {self.total}'
+        yield f'{name}_sum{{{labels}}} {self.sum:.6f}'
+        yield f'{name}_count{{{labels}}} {self.total}'
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = Lock()
+        self.latency = defaultdict(Histogram)       # endpoint -> request seconds
+        self.sql_statements = defaultdict(int)      # endpoint -> statements
+        self.sql_seconds = defaultdict(float)       # endpoint -> seconds in SQL
+        self.template_seconds = defaultdict(float)  # endpoint -> seconds rendering
+        self.stripe = defaultdict(Histogram)        # stripe call -> seconds
+        self.pool_wait = Histogram()                # seconds waiting for a pooled connection
+        self.profiler = None
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        before_render_template.connect(self._start_render, app)
+        template_rendered.connect(self._finish_render, app)
+        app.add_url_rule('/metrics', 'metrics', self.render)
+
+        if app.config.get('PROFILE_SLOW_REQUESTS'):
+            self.profiler = SamplingProfiler(app.config['PROFILE_SLOW_REQUESTS'],
+                                             os.path.join(app.instance_path, 'profiles'))
+            app.teardown_request(self.profiler.discard)  # requests that raised never reach after_request
+
+    def _start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+        g.template_seconds = 0.0
+        if self.profiler:
+            self.profiler.start()
+
+    def _finish_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_start
+        endpoint = request.endpoint or 'unmatched'
+        with self._lock:
+            self.latency[endpoint].observe(elapsed)
+            self.sql_statements[endpoint] += g.sql_statements
+            self.sql_seconds[endpoint] += g.sql_seconds
+            self.template_seconds[endpoint] += g.template_seconds
+        if self.profiler:
+            self.profiler.stop(endpoint, elapsed)
+        return response
+
+    def _start_render(self, app, template, context, **extra):
+        g.render_start = time.perf_counter()
+
+    def _finish_render(self, app, template, context, **extra):
+        if 'render_start' in g and 'template_seconds' in g:
+            g.template_seconds += time.perf_counter() - g.render_start
+
+    @contextmanager
+    def time_stripe(self, call):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.stripe[call].observe(elapsed)
+
+    def observe_pool_wait(self, seconds):
+        with self._lock:
+            self.pool_wait.observe(seconds)
+
+    def allowed(self):
+        # Prometheus sends METRICS_TOKEN as a bearer token:
+        #
+        #     scrape_configs:
+        #       - job_name: ecom
+        #         authorization: {credentials: <METRICS_TOKEN>}
+        #
+        # Admins can also read it from a logged-in browser, like /admin/jobs.
+        token = current_app.config.get('METRICS_TOKEN')
+        header = request.headers.get('Authorization', '')
+        if token and hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return True
+        return current_user.is_authenticated and current_user.is_admin
+
+    def render(self):
+        if not self.allowed():
+            return Response('Unauthorized\n', 401, {'WWW-Authenticate': 'Bearer'}, mimetype='text/plain')
+
+        from .catalog import catalog_cache
+        from .jobs import job_queue
+        from .principals import principals
+        from .replicas import router
+        from .fragments import fragment_cache
+        from .ratelimit import limiter
+        from .init import db
+
+        lines = ['# TYPE ecom_request_seconds histogram']
+        with self._lock:
+            for endpoint, histogram in sorted(self.latency.items()):
+                lines.extend(histogram.lines('ecom_request_seconds', f'endpoint="{endpoint}"'))
+            for name, values in (('ecom_sql_statements_total', self.sql_statements),
+                                 ('ecom_sql_seconds_total', self.sql_seconds),
+                                 ('ecom_template_render_seconds_total', self.template_seconds)):
+                lines.append(f'# TYPE {name} counter')
+                lines.extend(f'{name}{{endpoint="{endpoint}"}} {value}' for endpoint, value in sorted(values.items()))
+            lines.append('# TYPE ecom_stripe_call_seconds histogram')
+            for call, histogram in sorted(self.stripe.items()):
+                lines.extend(histogram.lines('ecom_stripe_call_seconds', f'call="{call}"'))
+            lines.append('# TYPE ecom_db_pool_wait_seconds histogram')
+            lines.extend(self.pool_wait.lines('ecom_db_pool_wait_seconds', 'pool="default"'))
+
+        fragments = fragment_cache.stats()
+        lines.append('# TYPE ecom_fragment_cache_hits_total counter')
+        lines.append(f'ecom_fragment_cache_hits_total {fragments["hits"]}')
+        lines.append('# TYPE ecom_fragment_cache_misses_total counter')
+        lines.append(f'ecom_fragment_cache_misses_total {fragments["misses"]}')
+        lines.append('# TYPE ecom_fragment_render_seconds_saved_total counter')
+        lines.append(f'ecom_fragment_render_seconds_saved_total {fragments["seconds_saved"]:.6f}')
+
+        lines.append('# TYPE ecom_rate_limited_total counter')
+        lines.extend(f'ecom_rate_limited_total{{limit="{name}"}} {count}' for name, count in sorted(limiter.stats().items()))
+
+        lines.append('# TYPE ecom_db_reads_total counter')
+        lines.extend(f'ecom_db_reads_total{{target="{target}"}} {count}' for target, count in router.stats().items())
+
+        pool = db.engine.pool
+        if isinstance(pool, QueuePool):
+            for name, value in (('ecom_db_pool_size', pool.size()),
+                                ('ecom_db_pool_checked_out', pool.checkedout()),
+                                ('ecom_db_pool_overflow', max(pool.overflow(), 0))):
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {value}')
+
+        cache = catalog_cache.stats()
+        lines.append('# TYPE ecom_catalog_cache_hits_total counter')
+        lines.append(f'ecom_catalog_cache_hits_total {cache["hits"]}')
+        lines.append('# TYPE ecom_catalog_cache_misses_total counter')
+        lines.append(f'ecom_catalog_cache_misses_total {cache["misses"]}')
+
+        users = principals.stats()
+        lines.append('# TYPE ecom_principal_cache_hits_total counter')
+        lines.append(f'ecom_principal_cache_hits_total {users["hits"]}')
+        lines.append('# TYPE ecom_principal_cache_misses_total counter')
+        lines.append(f'ecom_principal_cache_misses_total {users["misses"]}')
+
+        jobs = job_queue.stats()
+        lines.append('# TYPE ecom_job_queue_depth gauge')
+        lines.append(f'ecom_job_queue_depth {jobs["pending"]}')
+        lines.append('# TYPE ecom_job_stuck gauge')
+        lines.append(f'ecom_job_stuck {jobs["stuck"]}')
+        lines.append('# TYPE ecom_job_processed_total counter')
+        lines.append(f'ecom_job_processed_total {jobs["processed"]}')
+        lines.append('# TYPE ecom_job_latency_seconds_avg gauge')
+        lines.append(f'ecom_job_latency_seconds_avg {jobs["avg_latency"]:.6f}')
+
+        return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+class SamplingProfiler:
+    # Samples the stacks of threads that are serving a request and, for requests
+    # slower than the threshold, writes them in folded format for flamegraph.pl
+    # or speedscope.
+
+    def __init__(self, threshold, directory, interval=0.005):
+        self.threshold = float(threshold)
+        self.directory = directory
+        self.interval = interval
+        self.active = {}  # thread id -> Counter of folded stacks
+        self.thread = None
+        self._lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        # The sampling thread starts with the first request: one started in
+        # create_app would stay behind in the master of a preloading server
+        if self.thread is None or not self.thread.is_alive():
+            with self._lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = Thread(target=self._sample, name='profiler', daemon=True)
+                    self.thread.start()
+        self.active[get_ident()] = Counter()
+
+    def discard(self, exc=None):
+        self.active.pop(get_ident(), None)
+
+    def stop(self, endpoint, elapsed):
+        stacks = self.active.pop(get_ident(), None)
+        if not stacks or elapsed < self.threshold:
+            return
+        path = os.path.join(self.directory, f'{int(time.time() * 1000)}-{endpoint}.folded')
+        with open(path, 'w') as f:
+            for stack, count in stacks.items():
+                f.write(f'{stack} {count}\n')
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for thread_id, stacks in list(self.active.items()):
+                frame = frames.get(thread_id)
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                stacks[';'.join(reversed(names))] += 1
+
+
+metrics = Metrics()
+
+
+class TimedQueuePool(QueuePool):
+    # Records how long each checkout waited, i.e. how close the pool is to exhausted
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.observe_pool_wait(time.perf_counter() - start)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_sql(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_sql(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('query_start', time.perf_counter())
+    if has_request_context() and 'sql_statements' in g:
+        g.sql_statements += 1
+        g.sql_seconds += elapsed
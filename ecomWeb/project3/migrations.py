@@ -0,0 +1,219 @@
+from sqlalchemy import MetaData, Table, Column, Index, ForeignKey, text, inspect
+from sqlalchemy import Integer, String, Text, Float, Boolean, Date, DateTime
+from sqlalchemy.schema import CreateTable, CreateIndex
+from .init import db
+
+
+# Schema changes are applied in order and recorded in schema_version, so an
+# existing database is brought up to date without dropping anything.
+#
+# The tables and indexes below are pinned as they were when each migration was
+# written, never taken from the live models: a new database goes through the
+# same steps as an old one and so ends up with exactly the same schema.
+
+metadata = MetaData()
+
+# Version 1, the tables the app originally created
+customer = Table(
+    'customer', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(50), nullable=False),
+    Column('email', String(100), unique=True, nullable=False),
+    Column('password', String(150), nullable=False),
+    Column('date_joined', DateTime))
+product = Table(
+    'product', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('product_name', String(100), nullable=False),
+    Column('description', String(500)),
+    Column('current_price', Float, nullable=False),
+    Column('previous_price', Float, nullable=False),
+    Column('product_picture', String(1500)),
+    Column('in_stock', Integer),
+    Column('flash_sale', Boolean),
+    Column('date_added', DateTime))
+cart = Table(
+    'cart', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('quantity', Integer),
+    Column('customer_link', Integer, ForeignKey('customer.id'), nullable=False),
+    Column('product_link', Integer, ForeignKey('product.id'), nullable=False))
+order = Table(
+    'order', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('price', Float, nullable=False),
+    Column('payment_id', String(1000), nullable=False),
+    Column('quantity', Integer),
+    Column('status', String(50), nullable=False),
+    Column('customer_link', Integer, ForeignKey('customer.id'), nullable=False),
+    Column('product_link', Integer, ForeignKey('product.id'), nullable=False))
+
+# Version 2
+HOT_PATH_INDEXES = [
+    Index('ix_cart_customer_product', cart.c.customer_link, cart.c.product_link, unique=True),
+    Index('ix_cart_product_link', cart.c.product_link),
+    Index('ix_order_customer_id', order.c.customer_link, order.c.id),
+    Index('ix_product_flash_sale', product.c.flash_sale),
+]
+
+# Version 3
+PAYMENT_ID_INDEX = Index('ix_order_payment_id', order.c.payment_id)
+
+# Version 4
+job = Table(
+    'job', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('kind', String(50), nullable=False),
+    Column('payload', Text, nullable=False),
+    Column('status', String(20), nullable=False),
+    Column('attempts', Integer),
+    Column('error', String(500)),
+    Column('created_at', DateTime),
+    Column('started_at', DateTime),
+    Column('finished_at', DateTime),
+    Index('ix_job_status_id', 'status', 'id'))
+
+# Version 6
+order_header = Table(
+    'order_header', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('payment_id', String(1000), unique=True, nullable=False),
+    Column('customer_link', Integer, ForeignKey('customer.id'), nullable=False),
+    Column('lines', Integer, nullable=False),
+    Column('items', Integer, nullable=False),
+    Column('total_cents', Integer, nullable=False),
+    Column('currency', String(3), nullable=False),
+    Column('created_at', DateTime),
+    Index('ix_order_header_customer_id', 'customer_link', 'id'))
+daily_revenue = Table(
+    'daily_revenue', metadata,
+    Column('day', Date, primary_key=True),
+    Column('orders', Integer, nullable=False),
+    Column('items', Integer, nullable=False),
+    Column('revenue_cents', Integer, nullable=False))
+product_revenue = Table(
+    'product_revenue', metadata,
+    Column('product_link', Integer, ForeignKey('product.id'), primary_key=True),
+    Column('items', Integer, nullable=False),
+    Column('revenue_cents', Integer, nullable=False))
+status_total = Table(
+    'status_total', metadata,
+    Column('status', String(50), primary_key=True),
+    Column('lines', Integer, nullable=False),
+    Column('revenue_cents', Integer, nullable=False))
+
+
+# Version 7
+checkout = Table(
+    'checkout', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('session_id', String(255), unique=True, nullable=False),
+    Column('customer_link', Integer, ForeignKey('customer.id'), nullable=False),
+    Column('lines', Text, nullable=False),
+    Column('created_at', DateTime))
+
+
+def _create(conn, *tables):
+    # Tables the app's old create_all() already made are left alone. CreateTable
+    # leaves out indexes; the migration that introduced each one creates it.
+    existing = set(inspect(conn).get_table_names())
+    for table in tables:
+        if table.name not in existing:
+            conn.execute(CreateTable(table))
+
+
+def _index(conn, *indexes):
+    for index in indexes:
+        if index.name not in {i['name'] for i in inspect(conn).get_indexes(index.table.name)}:
+            conn.execute(CreateIndex(index))
+
+
+def _create_tables(conn):
+    _create(conn, customer, product, cart, order)
+
+
+def _add_hot_path_indexes(conn):
+    # Merge duplicate cart lines first, otherwise the unique index can't be built
+    conn.execute(text(
+        "UPDATE cart SET quantity = (SELECT SUM(c2.quantity) FROM cart c2 "
+        "WHERE c2.customer_link = cart.customer_link AND c2.product_link = cart.product_link) "
+        "WHERE id IN (SELECT MIN(id) FROM cart GROUP BY customer_link, product_link HAVING COUNT(*) > 1)"))
+    conn.execute(text(
+        "DELETE FROM cart WHERE id NOT IN (SELECT MIN(id) FROM cart GROUP BY customer_link, product_link)"))
+
+    _index(conn, *HOT_PATH_INDEXES)
+
+
+def _add_payment_id_index(conn):
+    _index(conn, PAYMENT_ID_INDEX)
+
+
+def _create_job_table(conn):
+    _create(conn, job)
+    _index(conn, *job.indexes)
+
+
+def _prices_to_cents(conn):
+    # Float prices become integer cents plus a currency code. ROUND before the
+    # cast so 19.99 (stored as 19.989999...) becomes 1999, not 1998.
+    changes = {
+        'product': {'current_price': 'current_price_cents', 'previous_price': 'previous_price_cents'},
+        'order': {'price': 'price_cents'},
+    }
+    for table, columns in changes.items():
+        existing = {column['name'] for column in inspect(conn).get_columns(table)}
+        quoted = conn.dialect.identifier_preparer.quote(table)  # "order" is a keyword
+        if 'currency' not in existing:
+            conn.execute(text(f"ALTER TABLE {quoted} ADD COLUMN currency VARCHAR(3) NOT NULL DEFAULT 'usd'"))
+        for old, new in columns.items():
+            if new not in existing:
+                conn.execute(text(f"ALTER TABLE {quoted} ADD COLUMN {new} INTEGER NOT NULL DEFAULT 0"))
+            if old in existing:
+                conn.execute(text(f"UPDATE {quoted} SET {new} = CAST(ROUND({old} * 100) AS INTEGER)"))
+                conn.execute(text(f"ALTER TABLE {quoted} DROP COLUMN {old}"))
+
+
+def _add_order_reports(conn):
+    # Orders from before this migration get its date; the real one wasn't recorded
+    if 'created_at' not in {column['name'] for column in inspect(conn).get_columns('order')}:
+        quoted = conn.dialect.identifier_preparer.quote('order')
+        conn.execute(text(f"ALTER TABLE {quoted} ADD COLUMN created_at TIMESTAMP"))
+        conn.execute(text(f"UPDATE {quoted} SET created_at = CURRENT_TIMESTAMP"))
+    _create(conn, order_header, daily_revenue, product_revenue, status_total)
+    _index(conn, *order_header.indexes)
+
+    from .reporting import rebuild
+    rebuild(conn)
+
+
+def _create_checkout_table(conn):
+    _create(conn, checkout)
+
+
+MIGRATIONS = [
+    (1, 'create tables', _create_tables),
+    (2, 'cart, order and flash sale indexes', _add_hot_path_indexes),
+    (3, 'order payment id index', _add_payment_id_index),
+    (4, 'job queue table', _create_job_table),
+    (5, 'prices as integer cents', _prices_to_cents),
+    (6, 'order headers and revenue summaries', _add_order_reports),
+    (7, 'checkout cart snapshots', _create_checkout_table),
+]
+
+
+def current_version(conn):
+    conn.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY)"))
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def upgrade():
+    with db.engine.begin() as conn:
+        version = current_version(conn)
+
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        with db.engine.begin() as conn:
+            migrate(conn)
+            conn.execute(text("INSERT INTO schema_version (version) VALUES (:v)"), {'v': number})
+        print(f'applied migration {number}: {description}')
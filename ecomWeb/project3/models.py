@@ -1,7 +1,8 @@
 from .init import db 
 from flask_login import UserMixin 
 from datetime import datetime  
-from flask_bcrypt import generate_password_hash, check_password_hash 
+from .passwords import hasher 
+from .money import CURRENCY 
 
 class Customer(db.Model, UserMixin): 
     id = db.Column(db.Integer, primary_key=True) 
@@ -17,44 +18,123 @@ class Customer(db.Model, UserMixin):
         return f"Customer('{self.username}', '{self.email}')"
 
     def verify_password (self, password):
-        return check_password_hash(self.password, password)  
+        return hasher.verify(self.password, password)  
+
+    def set_password(self, password):
+        self.password = hasher.hash(password)
 class Product(db.Model): 
     id = db.Column(db.Integer, primary_key=True)  
     product_name = db.Column(db.String(100), nullable=False)  
     description = db.Column(db.String(500), nullable=True)  
-    current_price = db.Column(db.Float, nullable=False)
-    previous_price = db.Column(db.Float, nullable=False) 
+    current_price_cents = db.Column(db.Integer, nullable=False)  # minor units, see money.py
+    previous_price_cents = db.Column(db.Integer, nullable=False) 
+    currency = db.Column(db.String(3), nullable=False, default=CURRENCY) 
     product_picture = db.Column(db.String(1500), nullable=True) 
     in_stock = db.Column(db.Integer, default=0) 
-    flash_sale = db.Column(db.Boolean, default=False) 
+    flash_sale = db.Column(db.Boolean, default=False, index=True) 
     date_added = db.Column(db.DateTime, default=datetime.utcnow)  
     carts = db.relationship('Cart', backref=db.backref('product', lazy=True)) 
     orders = db.relationship('Order',backref=db.backref('product', lazy=True)) 
 
 
     def __repr__(self):  
-        return f"Product('{self.product_name}', '{self.current_price}')"
+        return f"Product('{self.product_name}', '{self.current_price_cents}')"
 
 
 class Cart(db.Model): 
     id = db.Column(db.Integer, primary_key=True)
     quantity = db.Column(db.Integer, default=0) 
     customer_link = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False) 
-    product_link = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)  
+    product_link = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False, index=True)  
+
+    __table_args__ = (db.Index('ix_cart_customer_product', 'customer_link', 'product_link', unique=True),)
 
     def __repr__(self):
         return f'(Cart {self.id} - {self.product_link})'
 
 class Order(db.Model): 
     id = db.Column(db.Integer, primary_key=True) 
-    price = db.Column(db.Float, nullable=False)
-    payment_id = db.Column(db.String(1000), nullable=False)
+    price_cents = db.Column(db.Integer, nullable=False)  # line total: unit price * quantity
+    currency = db.Column(db.String(3), nullable=False, default=CURRENCY) 
+    payment_id = db.Column(db.String(1000), nullable=False, index=True)
     quantity = db.Column(db.Integer, default=1) 
     status = db.Column(db.String(50), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     customer_link = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False) 
     product_link = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False) 
 
+    __table_args__ = (db.Index('ix_order_customer_id', 'customer_link', 'id'),)
+
     def __repr__(self): 
 
-        return f"Order('{self.id}', '{self.price}', '{self.status}')"
+        return f"Order('{self.id}', '{self.price_cents}', '{self.status}')"
+
+
+class Job(db.Model): 
+    id = db.Column(db.Integer, primary_key=True) 
+    kind = db.Column(db.String(50), nullable=False) 
+    payload = db.Column(db.Text, nullable=False)  # JSON 
+    status = db.Column(db.String(20), nullable=False, default='pending') 
+    attempts = db.Column(db.Integer, default=0) 
+    error = db.Column(db.String(500), nullable=True) 
+    created_at = db.Column(db.DateTime, default=datetime.utcnow) 
+    started_at = db.Column(db.DateTime, nullable=True) 
+    finished_at = db.Column(db.DateTime, nullable=True) 
+
+    __table_args__ = (db.Index('ix_job_status_id', 'status', 'id'),)
+
+    def __repr__(self): 
+        return f"Job('{self.id}', '{self.kind}', '{self.status}')"
+
+
+class Checkout(db.Model): 
+    # The cart as it was when its Stripe Checkout Session was created, i.e. what
+    # the customer pays for. Orders are made from this, not from the live cart.
+    id = db.Column(db.Integer, primary_key=True) 
+    session_id = db.Column(db.String(255), nullable=False, unique=True) 
+    customer_link = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False) 
+    lines = db.Column(db.Text, nullable=False)  # JSON [{product_id, quantity, price_cents, currency}] 
+    created_at = db.Column(db.DateTime, default=datetime.utcnow) 
+
+    def __repr__(self): 
+        return f"Checkout('{self.session_id}', '{self.customer_link}')"
+
+
+# Reporting tables, kept up to date by reporting.py as orders are created and
+# change status, so the order pages and admin KPIs don't scan the order table.
+
+class OrderHeader(db.Model): 
+    id = db.Column(db.Integer, primary_key=True) 
+    payment_id = db.Column(db.String(1000), nullable=False, unique=True) 
+    customer_link = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False) 
+    lines = db.Column(db.Integer, nullable=False) 
+    items = db.Column(db.Integer, nullable=False) 
+    total_cents = db.Column(db.Integer, nullable=False) 
+    currency = db.Column(db.String(3), nullable=False, default=CURRENCY) 
+    created_at = db.Column(db.DateTime, default=datetime.utcnow) 
+    customer = db.relationship('Customer') 
+
+    __table_args__ = (db.Index('ix_order_header_customer_id', 'customer_link', 'id'),)
+
+    def __repr__(self): 
+        return f"OrderHeader('{self.payment_id}', '{self.total_cents}')"
+
+
+class DailyRevenue(db.Model): 
+    day = db.Column(db.Date, primary_key=True) 
+    orders = db.Column(db.Integer, nullable=False, default=0) 
+    items = db.Column(db.Integer, nullable=False, default=0) 
+    revenue_cents = db.Column(db.Integer, nullable=False, default=0) 
+
+
+class ProductRevenue(db.Model): 
+    product_link = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True) 
+    items = db.Column(db.Integer, nullable=False, default=0) 
+    revenue_cents = db.Column(db.Integer, nullable=False, default=0) 
+
+
+class StatusTotal(db.Model): 
+    status = db.Column(db.String(50), primary_key=True) 
+    lines = db.Column(db.Integer, nullable=False, default=0) 
+    revenue_cents = db.Column(db.Integer, nullable=False, default=0) 
@@ -0,0 +1,22 @@
+from decimal import Decimal, ROUND_HALF_UP
+
+
+# Prices are stored as integer minor units (cents) next to a currency code, so
+# sums are exact and Stripe's unit_amount is the stored value. All currencies
+# used here have two decimal places.
+
+CURRENCY = 'usd'
+CENT = Decimal('0.01')
+
+
+def to_cents(value):
+    # Decimal, str or float (e.g. 19.99) -> 1999, rounding half up rather than truncating
+    return int(Decimal(str(value)).quantize(CENT, ROUND_HALF_UP) * 100)
+
+
+def from_cents(cents):
+    return (Decimal(cents or 0) / 100).quantize(CENT)
+
+
+def format_cents(cents):
+    return f'{from_cents(cents):.2f}'
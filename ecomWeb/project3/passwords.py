@@ -0,0 +1,56 @@
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+import multiprocessing
+import bcrypt
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password, hashed):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    except ValueError:  # not a bcrypt hash
+        return False
+
+
+class PasswordHasher:
+    # bcrypt with a configurable cost. With PASSWORD_HASH_WORKERS > 0 the work runs
+    # in a process pool of that size, so a login burst is spread over the cores and
+    # can't occupy more of them than that.
+
+    def __init__(self):
+        self.rounds = 12
+        self.workers = 0
+        self._pool = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.rounds = app.config.get('BCRYPT_LOG_ROUNDS', 12)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+        with self._lock:
+            if self._pool is None:
+                # Created on first use, i.e. after any pre-fork; spawn avoids forking our threads
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool.submit(func, *args).result()
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, hashed, password):
+        return self._run(_verify, password, hashed)
+
+    def needs_rehash(self, hashed):
+        # "$2b$12$..." -> 12
+        try:
+            return int(hashed.split('$')[2]) < self.rounds
+        except (IndexError, ValueError):
+            return True
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,115 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from .metrics import metrics
+
+
+class PaymentGateway:
+    def __init__(self):
+        self.executor = None
+        self.app = None
+        self._stripe = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self._stripe = None
+        if app.config.get('PAYMENT_CONFIRM_ASYNC'):
+            self.executor = ThreadPoolExecutor(max_workers=app.config.get('PAYMENT_WORKERS', 4),
+                                               thread_name_prefix='payments')
+
+    @property
+    def stripe(self):
+        # stripe and requests are imported and configured on the first payment call
+        # (or by warm_up before a preloading server forks), not at every process start
+        if self._stripe is None:
+            with self._lock:
+                if self._stripe is None:
+                    self._stripe = self._configure(self.app.config)
+        return self._stripe
+
+    def _configure(self, config):
+        from requests.adapters import HTTPAdapter
+        import requests
+        import stripe
+
+        stripe.api_key = config.get('STRIPE_API_KEY')
+        if config.get('STRIPE_API_BASE'):
+            stripe.api_base = config['STRIPE_API_BASE']  # e.g. the local fake_stripe server
+        stripe.max_network_retries = config.get('STRIPE_MAX_RETRIES', 2)  # retried with backoff by stripe
+
+        # One keep-alive session shared by every request instead of a new TLS handshake per call
+        session = requests.Session()
+        pool_size = config.get('STRIPE_POOL_SIZE', 10)
+        session.mount('https://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        session.mount('http://', HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        stripe.default_http_client = stripe.RequestsClient(
+            timeout=(config.get('STRIPE_CONNECT_TIMEOUT', 3), config.get('STRIPE_READ_TIMEOUT', 10)),
+            session=session)
+        return stripe
+
+    def create_checkout_session(self, line_items, success_url, cancel_url, customer_id):
+        with metrics.time_stripe('checkout.Session.create'):
+            return self.stripe.checkout.Session.create(
+                payment_method_types=['card'],
+                line_items=line_items,
+                mode='payment',
+                success_url=success_url,
+                cancel_url=cancel_url,
+                client_reference_id=str(customer_id),  # lets the webhook find whose cart was paid
+            )
+
+    def parse_webhook(self, payload, signature):
+        # Raises ValueError / stripe.error.SignatureVerificationError on a bad request
+        return self.stripe.Webhook.construct_event(payload, signature, self.app.config['STRIPE_WEBHOOK_SECRET'])
+
+    def confirm_payment(self, session_id, customer_id):
+        # Returns the payment intent id of a paid checkout session, or None. The
+        # session must be the customer's own: success URLs leak through history,
+        # logs and referers, and another cart must not be recorded under them.
+        with metrics.time_stripe('checkout.Session.retrieve'):
+            session = self.stripe.checkout.Session.retrieve(session_id)
+        if session.client_reference_id != str(customer_id):
+            print('Checkout session', session_id, 'does not belong to customer', customer_id)
+            return None
+        if session.payment_status != 'paid':
+            return None
+        with metrics.time_stripe('PaymentIntent.retrieve'):
+            payment_intent = self.stripe.PaymentIntent.retrieve(session.payment_intent)
+        return payment_intent.id
+
+    def refund(self, payment_id):
+        # The idempotency key makes a retried job refund only once
+        with metrics.time_stripe('Refund.create'):
+            return self.stripe.Refund.create(payment_intent=payment_id, idempotency_key=f'refund-{payment_id}')
+
+    def finalize_or_refund(self, customer_id, payment_id, session_id):
+        # Stock that ran out while the customer was paying can't be ordered any
+        # more; they get their money back instead of a charge and no order
+        from .checkout import finalize_order, OutOfStock
+
+        try:
+            return finalize_order(customer_id, payment_id, session_id)
+        except OutOfStock:
+            print('Out of stock after payment, refunding', payment_id)
+            self.refund(payment_id)
+            raise
+
+    def confirm_and_finalize(self, session_id, customer_id):
+        payment_id = self.confirm_payment(session_id, customer_id)
+        if payment_id is None:
+            return None
+        return self.finalize_or_refund(customer_id, payment_id, session_id)
+
+    def submit_confirmation(self, session_id, customer_id):
+        # Hands the provider round trips to a worker so the request thread returns at once
+        self.executor.submit(self._confirm_in_background, session_id, customer_id)
+
+    def _confirm_in_background(self, session_id, customer_id):
+        with self.app.app_context():
+            try:
+                self.confirm_and_finalize(session_id, customer_id)
+            except Exception as e:
+                print('Error confirming payment', session_id, e)
+
+
+gateway = PaymentGateway()
@@ -0,0 +1,23 @@
+from sqlalchemy import func
+from .models import Cart, Product
+from .init import db
+from .money import format_cents
+
+
+SHIPPING_FEE_CENTS = 10000  # flat fee added to every cart total
+
+
+def cart_totals(customer_id):
+    # One integer SUM(price * quantity) over the customer's cart instead of loading every row
+    amount = db.session.query(func.coalesce(func.sum(Product.current_price_cents * Cart.quantity), 0)) \
+        .select_from(Cart) \
+        .join(Product, Cart.product_link == Product.id) \
+        .filter(Cart.customer_link == customer_id).scalar()
+    total = amount + SHIPPING_FEE_CENTS
+
+    return {
+        'amount_cents': amount,
+        'total_cents': total,
+        'amount': format_cents(amount),
+        'total': format_cents(total),
+    }
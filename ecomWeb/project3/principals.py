@@ -0,0 +1,72 @@
+from flask_login import UserMixin, AnonymousUserMixin
+from .models import Customer
+from .caches import LRUCache, RedisCache
+from .changes import changes
+
+
+class Principal(UserMixin):
+    # What flask-login keeps as current_user: the few fields requests need, so
+    # they don't load the Customer row. Views that edit the customer load it.
+
+    def __init__(self, id, username, email, is_admin=False):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.is_admin = is_admin
+
+
+class AnonymousPrincipal(AnonymousUserMixin):
+    is_admin = False
+
+
+class PrincipalCache:
+    def __init__(self):
+        self.backend = LRUCache(maxsize=10000, ttl=300)
+        self.admin_ids = {1}
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app, login_manager):
+        ttl = app.config.get('PRINCIPAL_CACHE_TTL', 300)
+        url = app.config.get('PRINCIPAL_CACHE_URL')
+        self.backend = RedisCache(url, ttl=ttl, prefix='principal:') if url else LRUCache(maxsize=10000, ttl=ttl)
+        self.admin_ids = set(app.config.get('ADMIN_IDS', [1]))
+        login_manager.user_loader(self.load)
+        login_manager.anonymous_user = AnonymousPrincipal
+
+    def load(self, id):
+        key = str(int(id))
+        data = self.backend.get(key)
+        if data is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            row = Customer.query.with_entities(Customer.id, Customer.username, Customer.email) \
+                .filter_by(id=int(id)).first()
+            if row is None:
+                return None
+            data = {'id': row.id, 'username': row.username, 'email': row.email}
+            self.backend.set(key, data)
+        return Principal(data['id'], data['username'], data['email'], is_admin=data['id'] in self.admin_ids)
+
+    def invalidate(self, id):
+        self.backend.delete(str(id))
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+principals = PrincipalCache()
+
+
+# Profile and password changes drop the cached principal once they commit
+
+@changes.subscribe(Customer)
+def _invalidate_principals(rows, bulk):
+    if bulk:
+        principals.clear()
+    for customer_id in rows:
+        principals.invalidate(customer_id)
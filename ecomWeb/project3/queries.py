@@ -0,0 +1,49 @@
+from collections import defaultdict
+from sqlalchemy.orm import joinedload
+from .models import Cart, Order, OrderHeader
+
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+# Cart/Order rows are always rendered together with their product (and, on the
+# admin screen, the customer), so load those relationships in the same SELECT
+# instead of one lazy query per row in the templates.
+
+def cart_items(customer_id):
+    return Cart.query.options(joinedload(Cart.product)) \
+        .filter_by(customer_link=customer_id).all()
+
+
+def customer_orders(customer_id):
+    return OrderHeader.query.filter_by(customer_link=customer_id)
+
+
+def all_orders():
+    return OrderHeader.query.options(joinedload(OrderHeader.customer))
+
+
+def order_page(headers_query, after=0, size=PAGE_SIZE):
+    # A keyset page of order headers (one per payment_id), each paired with its
+    # line items, which are loaded for the whole page in one SELECT.
+    headers, next_cursor = keyset_page(headers_query, OrderHeader.id, after, size)
+    lines = defaultdict(list)
+    if headers:
+        for order in Order.query.options(joinedload(Order.product)) \
+                .filter(Order.payment_id.in_([header.payment_id for header in headers])).order_by(Order.id):
+            lines[order.payment_id].append(order)
+    return [(header, lines[header.payment_id]) for header in headers], next_cursor
+
+
+def keyset_page(query, column, after=0, size=PAGE_SIZE):
+    # Seek on an indexed column (WHERE column > cursor) rather than OFFSET, so
+    # every page costs the same no matter how deep into the table it is.
+    size = max(1, min(size, MAX_PAGE_SIZE))
+    rows = query.filter(column > after).order_by(column).limit(size + 1).all()
+
+    next_cursor = None
+    if len(rows) > size:
+        rows = rows[:size]
+        next_cursor = getattr(rows[-1], column.key)
+    return rows, next_cursor
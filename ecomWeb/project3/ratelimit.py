@@ -0,0 +1,126 @@
+from collections import defaultdict
+from functools import wraps
+from threading import Lock
+from flask import request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+import math
+import time
+
+
+class MemoryBackend:
+    # Token buckets in a dict per shard, each with its own lock, so concurrent
+    # requests for different keys rarely wait on each other.
+
+    def __init__(self, shards=64, max_keys=100000):
+        self.shards = [({}, Lock()) for _ in range(shards)]
+        self.max_keys = max_keys // shards
+
+    def take(self, key, capacity, rate):
+        # Returns 0 if a token was taken, else the seconds until one is available
+        buckets, lock = self.shards[hash(key) % len(self.shards)]
+        now = time.monotonic()
+        with lock:
+            tokens, updated, _ = buckets.get(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            buckets[key] = (tokens, now, now + (capacity - tokens) / rate)  # last is when it's full again
+            if len(buckets) > self.max_keys:
+                self._evict(buckets, now)
+            return wait
+
+    def _evict(self, buckets, now):
+        # A bucket that has refilled is the same as no bucket at all
+        for key, (_, _, full_at) in list(buckets.items()):
+            if full_at <= now:
+                del buckets[key]
+        while len(buckets) > self.max_keys:
+            del buckets[next(iter(buckets))]  # oldest insertion
+
+
+class RedisBackend:
+    # The same bucket as a Lua script, so the read-refill-take is atomic across workers
+    SCRIPT = """
+    local capacity, rate, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated) * rate)
+    local wait = 0
+    if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return tostring(wait)
+    """
+
+    def __init__(self, url, prefix='ratelimit:'):
+        import redis  # optional dependency, only needed when RATE_LIMIT_URL is set
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(self.SCRIPT)
+        self.prefix = prefix
+
+    def take(self, key, capacity, rate):
+        return float(self.script(keys=[self.prefix + key], args=[capacity, rate, time.time()]))
+
+
+class RateLimiter:
+    def __init__(self):
+        self.backend = MemoryBackend()
+        self.enabled = True
+        self.throttled = defaultdict(int)  # limit name -> rejected requests
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RATE_LIMIT_ENABLED', True)
+        url = app.config.get('RATE_LIMIT_URL')
+        if self.enabled and not url and app.config.get('APP_ENV') == 'production':
+            # In-process buckets are per worker: under gunicorn every limit would
+            # quietly allow workers times its rate
+            raise ValueError('Set RATE_LIMIT_URL to a redis:// URL shared by all workers, '
+                             'or to memory:// for a single-process deployment')
+        if url and url != 'memory://':
+            self.backend = RedisBackend(url)
+        else:
+            self.backend = MemoryBackend(app.config.get('RATE_LIMIT_SHARDS', 64))
+
+    def check(self, name, key, capacity, per):
+        wait = self.backend.take(f'{name}:{key}', capacity, capacity / per)
+        if wait:
+            self.throttled[name] += 1
+            raise TooManyRequests(retry_after=math.ceil(wait))
+
+    def stats(self):
+        return dict(self.throttled)
+
+
+limiter = RateLimiter()
+
+
+def by_ip():
+    return request.remote_addr  # behind a proxy, run the app with ProxyFix
+
+
+def by_user():
+    return current_user.id if current_user.is_authenticated else None
+
+
+def by_form(field):
+    return lambda: (request.form.get(field) or '').strip().lower() or None
+
+
+def rate_limit(name, capacity, per, key=by_ip, methods=None):
+    # Allows `capacity` requests per `per` seconds for each key, refilled
+    # continuously; stack several for per-IP and per-account limits.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if limiter.enabled and (methods is None or request.method in methods):
+                value = key()
+                if value is not None:
+                    limiter.check(name, value, capacity, per)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
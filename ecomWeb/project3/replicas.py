@@ -0,0 +1,121 @@
+from contextlib import contextmanager
+from functools import wraps
+from itertools import cycle
+from threading import Lock
+from flask import g, session as http_session, has_request_context
+from flask_sqlalchemy.session import Session as BaseSession
+from sqlalchemy import event
+from sqlalchemy.sql import Select
+import time
+
+
+class ReplicaRouter:
+    # Views marked @read_replica send their SELECTs to a replica bind. Once a
+    # visitor has written something they stay on the primary for STICKY_SECONDS,
+    # so they read their own cart/order changes whatever the replication lag.
+
+    def __init__(self):
+        self.bind_keys = []
+        self.sticky_seconds = 5
+        self._next = None
+        self._lock = Lock()
+        self.reads = {'primary': 0, 'replica': 0}
+
+    def init_app(self, app):
+        self.bind_keys = [key for key in app.config.get('SQLALCHEMY_BINDS', {}) if key.startswith('replica_')]
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+        self._next = cycle(self.bind_keys) if self.bind_keys else None
+
+    def pick(self, engines):
+        with self._lock:
+            return engines[next(self._next)]
+
+    def wants_replica(self):
+        if self._next is None or not has_request_context() or not g.get('read_replica'):
+            return False
+        return http_session.get('primary_until', 0) < time.time()
+
+    def stick_to_primary(self):
+        if has_request_context() and self.bind_keys:
+            http_session['primary_until'] = time.time() + self.sticky_seconds
+
+    def stats(self):
+        return dict(self.reads)
+
+    def sync_sqlite(self, engines):
+        # Local stand-in for replication: copy the primary SQLite file over each replica
+        primary = engines[None].raw_connection()
+        try:
+            for key in self.bind_keys:
+                if engines[key].dialect.name != 'sqlite':
+                    raise ValueError(f'{key} is not SQLite; use the database\'s own replication')
+                replica = engines[key].raw_connection()
+                try:
+                    primary.driver_connection.backup(replica.driver_connection)
+                finally:
+                    replica.close()
+        finally:
+            primary.close()
+
+
+router = ReplicaRouter()
+
+
+def read_replica(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def on_primary():
+    # For reads that fill a shared cache: a miss right after an invalidation read
+    # from a lagging replica would store the old rows under the new version, to be
+    # served to everyone until the TTL.
+    if not has_request_context():
+        yield
+        return
+    previous = g.get('read_replica')
+    g.read_replica = False
+    try:
+        yield
+    finally:
+        g.read_replica = previous
+
+
+class RoutingSession(BaseSession):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and isinstance(clause, Select) and not self._flushing
+                and not self.info.get('wrote') and router.wants_replica()):
+            router.reads['replica'] += 1
+            return router.pick(self._db.engines)
+        if isinstance(clause, Select):
+            router.reads['primary'] += 1
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# A session that has written reads from the primary until it commits, and the
+# commit starts the visitor's sticky window.
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_flush(session, flush_context):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _mark_write(orm_execute_state):
+    if not orm_execute_state.is_select:
+        orm_execute_state.session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _start_sticky_window(session):
+    if session.info.pop('wrote', False):
+        router.stick_to_primary()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _reset_write_flag(session):
+    session.info.pop('wrote', None)
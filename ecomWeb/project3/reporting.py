@@ -0,0 +1,121 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models import Order, OrderHeader, DailyRevenue, ProductRevenue, StatusTotal, Product
+from .init import db
+
+
+# Summary rows are bumped in the same transaction that creates or changes the
+# orders, so they always agree with the order table. rebuild() recomputes them
+# from scratch (migration 6 and `flask rebuild-reports`).
+
+UPSERTS = {'sqlite': sqlite_insert, 'postgresql': pg_insert}
+
+
+def _bump(model, key, **increments):
+    # INSERT the row or add the increments to the existing one
+    _bump_many(model, list(key), [dict(key, **increments)])
+
+
+def _bump_many(model, key, rows):
+    # _bump for many rows (dicts of the key and increment columns, distinct keys)
+    # as a single executemany upsert
+    increments = [name for name in rows[0] if name not in key]
+    upsert = UPSERTS.get(db.engine.dialect.name)
+    if upsert is not None:
+        stmt = upsert(model)
+        stmt = stmt.on_conflict_do_update(index_elements=key, set_={
+            name: getattr(model, name) + stmt.excluded[name] for name in increments})
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        conditions = [getattr(model, name) == row[name] for name in key]
+        updated = db.session.execute(update(model).where(*conditions).values(**{
+            name: getattr(model, name) + row[name] for name in increments})
+            .execution_options(synchronize_session=False)).rowcount
+        if not updated:
+            db.session.execute(insert(model).values(**row))
+
+
+def record_orders(customer_id, payment_id, rows, created_at):
+    # rows: the Order dicts finalize_order just inserted for this payment
+    items = sum(row['quantity'] for row in rows)
+    total = sum(row['price_cents'] for row in rows)
+    db.session.execute(insert(OrderHeader).values(
+        payment_id=payment_id, customer_link=customer_id, lines=len(rows), items=items,
+        total_cents=total, currency=rows[0]['currency'], created_at=created_at))
+
+    _bump(DailyRevenue, {'day': created_at.date()}, orders=1, items=items, revenue_cents=total)
+
+    by_product = defaultdict(lambda: [0, 0])
+    by_status = defaultdict(lambda: [0, 0])
+    for row in rows:
+        by_product[row['product_link']][0] += row['quantity']
+        by_product[row['product_link']][1] += row['price_cents']
+        by_status[row['status']][0] += 1
+        by_status[row['status']][1] += row['price_cents']
+    _bump_many(ProductRevenue, ['product_link'], [
+        {'product_link': product, 'items': items, 'revenue_cents': revenue}
+        for product, (items, revenue) in by_product.items()])
+    _bump_many(StatusTotal, ['status'], [
+        {'status': status, 'lines': lines, 'revenue_cents': revenue}
+        for status, (lines, revenue) in by_status.items()])
+
+
+def record_status_change(order, old_status):
+    if order.status == old_status:
+        return
+    _bump(StatusTotal, {'status': old_status}, lines=-1, revenue_cents=-order.price_cents)
+    _bump(StatusTotal, {'status': order.status}, lines=1, revenue_cents=order.price_cents)
+
+
+def rebuild(conn):
+    for model in (OrderHeader, DailyRevenue, ProductRevenue, StatusTotal):
+        conn.execute(delete(model))
+
+    conn.execute(insert(OrderHeader).from_select(
+        ['payment_id', 'customer_link', 'lines', 'items', 'total_cents', 'currency', 'created_at'],
+        select(Order.payment_id, func.min(Order.customer_link), func.count(), func.sum(Order.quantity),
+               func.sum(Order.price_cents), func.min(Order.currency), func.min(Order.created_at))
+        .group_by(Order.payment_id).order_by(func.min(Order.id))))
+
+    day = func.date(OrderHeader.created_at)
+    conn.execute(insert(DailyRevenue).from_select(
+        ['day', 'orders', 'items', 'revenue_cents'],
+        select(day, func.count(), func.sum(OrderHeader.items), func.sum(OrderHeader.total_cents))
+        .where(OrderHeader.created_at.is_not(None)).group_by(day)))
+    conn.execute(insert(ProductRevenue).from_select(
+        ['product_link', 'items', 'revenue_cents'],
+        select(Order.product_link, func.sum(Order.quantity), func.sum(Order.price_cents))
+        .group_by(Order.product_link)))
+    conn.execute(insert(StatusTotal).from_select(
+        ['status', 'lines', 'revenue_cents'],
+        select(Order.status, func.count(), func.sum(Order.price_cents)).group_by(Order.status)))
+
+
+def kpis(days=7, top=5):
+    # A handful of reads from the summary tables, however many orders exist
+    totals = db.session.execute(select(
+        func.coalesce(func.sum(DailyRevenue.orders), 0),
+        func.coalesce(func.sum(DailyRevenue.items), 0),
+        func.coalesce(func.sum(DailyRevenue.revenue_cents), 0))).one()
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    recent = DailyRevenue.query.filter(DailyRevenue.day >= since).order_by(DailyRevenue.day.desc()).all()
+    products = db.session.execute(
+        select(Product.product_name, ProductRevenue.items, ProductRevenue.revenue_cents)
+        .join(Product, Product.id == ProductRevenue.product_link)
+        .order_by(ProductRevenue.revenue_cents.desc()).limit(top)).all()
+    statuses = StatusTotal.query.filter(StatusTotal.lines > 0).order_by(StatusTotal.status).all()
+
+    return {
+        'orders': totals[0],
+        'items': totals[1],
+        'revenue_cents': totals[2],
+        'today': recent[0] if recent and recent[0].day == datetime.utcnow().date() else None,
+        'recent': recent,
+        'top_products': products,
+        'statuses': statuses,
+    }
@@ -0,0 +1,360 @@
+from bisect import bisect_left, insort
+from heapq import heappop, heappush, nlargest, nsmallest
+from collections import defaultdict
+from itertools import chain, compress, groupby, islice
+from threading import Lock, RLock, Thread
+from operator import add, itemgetter, neg
+from .changes import changes
+from .models import Product
+import math
+import re
+import sys
+import time
+
+
+TOKEN = re.compile(r'\w+')
+NAME_WEIGHT = 3  # a match in the product name counts more than one in the description
+MIN_PREFIX = 2   # shorter last words only match whole terms
+MAX_PREFIX_TERMS = 50  # a prefix expands to at most this many terms, the most common first
+SCORE_ALL_BELOW = 10000  # a word matching fewer products has every match scored
+MAX_COUNT = 1000  # past this (or the requested page) big result sets are counted as "more than"
+
+
+def tokenize(text):
+    return TOKEN.findall((text or '').lower())
+
+
+def _weights(name, description):
+    weights = defaultdict(int)
+    for term in tokenize(name):
+        weights[term] += NAME_WEIGHT
+    for term in tokenize(description):
+        weights[term] += 1
+    return dict(weights)
+
+
+def _idf(matches, total):
+    return math.log(1 + total / (1 + matches))
+
+
+def _levels(postings):
+    # Product ids grouped by score, best first. Weights are small whole numbers,
+    # so a term has a handful of scores however many products it matches.
+    levels = defaultdict(list)
+    for product_id, score in postings.items():
+        levels[score].append(product_id)
+    return sorted(levels.items(), reverse=True)
+
+
+class _Index:
+    # Searches read an _Index without holding the lock while they score, so
+    # update() never changes a postings dict or the terms list in place: it
+    # replaces the ones it touches, and a search keeps the ones it picked up.
+
+    def __init__(self):
+        self.postings = {}   # term -> {product_id: weight * idf}, in product id order
+        self.levels = {}     # term -> [(score, product ids)], see _levels
+        self.doc_terms = {}  # product_id -> {term: weight}, for updates and removals
+        self.terms = []      # sorted, for prefix lookups
+
+    @classmethod
+    def build(cls, rows):
+        index = cls()
+        weights = defaultdict(dict)
+        for product_id, name, description in rows:
+            terms = index.doc_terms[product_id] = _weights(name, description)
+            for term, weight in terms.items():
+                weights[term][product_id] = weight
+        total = len(index.doc_terms) or 1
+        for term, postings in weights.items():
+            idf = _idf(len(postings), total)
+            index.postings[term] = {pid: weight * idf for pid, weight in postings.items()}
+            index.levels[term] = _levels(index.postings[term])
+        index.terms = sorted(index.postings)
+        return index
+
+    def update(self, product_id, name, description):
+        # name None removes the product. Terms it doesn't touch keep the idf of
+        # the last build until the next one.
+        old = self.doc_terms.pop(product_id, {})
+        new = _weights(name, description) if name is not None else {}
+        if new:
+            self.doc_terms[product_id] = new
+        total = len(self.doc_terms) or 1
+        added, removed = [], []
+        for term in old.keys() | new.keys():
+            postings = {pid: score for pid, score in self.postings.get(term, {}).items() if pid != product_id}
+            if term in new:
+                in_order = not postings or next(reversed(postings)) < product_id
+                postings[product_id] = new[term] * _idf(len(postings) + 1, total)
+                if not in_order:
+                    postings = dict(sorted(postings.items()))
+            if postings:
+                if term not in self.postings:
+                    added.append(term)
+                self.postings[term] = postings
+                self.levels[term] = _levels(postings)
+            elif self.postings.pop(term, None) is not None:
+                del self.levels[term]
+                removed.append(term)
+        if added or removed:
+            terms = list(self.terms)
+            for term in removed:
+                del terms[bisect_left(terms, term)]
+            for term in added:
+                insort(terms, term)
+            self.terms = terms
+
+    def expand(self, prefix):
+        # The terms a last word stands for, most common first
+        postings, terms = self.postings, self.terms
+        if len(prefix) < MIN_PREFIX:
+            return [prefix] if prefix in postings else []
+        start = bisect_left(terms, prefix)
+        matches = terms[start:bisect_left(terms, prefix + chr(sys.maxunicode), start)]
+        if len(matches) <= MAX_PREFIX_TERMS:
+            return sorted(matches, key=lambda term: (-len(postings[term]), term))
+        counts = map(len, map(postings.__getitem__, matches))
+        return [term for _, term in nsmallest(MAX_PREFIX_TERMS, zip(map(neg, counts), matches))]
+
+
+class SearchIndex:
+    # Searches pick up the postings they need under the lock and score them
+    # outside it. Rebuilds read the catalog into a new _Index on a background
+    # thread and swap it in, so a search never waits for a rebuild except the
+    # very first; edits committed meanwhile are applied to both.
+
+    def __init__(self):
+        self._lock = RLock()
+        self._first_build = Lock()
+        self.index = _Index()
+        self.app = None
+        self.built_at = None
+        self.stale = True
+        self.ttl = 300
+        self.rebuilding = None  # edits to replay onto the index being built, while one is
+        self.thread = None
+
+    def init_app(self, app):
+        # Writes made by other worker processes are picked up by the periodic rebuild
+        self.app = app
+        self.ttl = app.config.get('SEARCH_INDEX_TTL', 300)
+
+    def ensure_built(self):
+        if self.built_at is None:
+            with self._first_build:  # one request builds, the others wait for it
+                if self.built_at is None:
+                    self.rebuild()
+        elif self.stale or time.monotonic() - self.built_at > self.ttl:
+            with self._lock:
+                if self.rebuilding is not None:
+                    return
+                self.rebuilding = []
+            self.thread = Thread(target=self._rebuild_in_background, name='search-index', daemon=True)
+            self.thread.start()
+
+    def _rebuild_in_background(self):
+        with self.app.app_context():
+            try:
+                self.rebuild()
+            except Exception as e:
+                print('Search index rebuild failed', e)
+                with self._lock:
+                    self.rebuilding = None
+                    self.built_at = time.monotonic()  # retried after the ttl, not on every search
+
+    def rebuild(self):
+        with self._lock:
+            if self.rebuilding is None:
+                self.rebuilding = []
+            replay = self.rebuilding
+            self.stale = False  # anything marked stale from here on needs the next rebuild
+        rows = Product.query.with_entities(Product.id, Product.product_name, Product.description) \
+            .order_by(Product.id).execution_options(yield_per=1000)
+        index = _Index.build(rows)
+        with self._lock:
+            for product_id, fields in replay:
+                index.update(product_id, *(fields or (None, None)))
+            self.index = index
+            if self.rebuilding is replay:
+                self.rebuilding = None
+            self.built_at = time.monotonic()
+
+    def update(self, product_id, name, description):
+        with self._lock:
+            if self.rebuilding is not None:
+                self.rebuilding.append((product_id, (name, description)))
+            if self.built_at is not None:
+                self.index.update(product_id, name, description)
+
+    def remove(self, product_id):
+        with self._lock:
+            if self.rebuilding is not None:
+                self.rebuilding.append((product_id, None))
+            self.index.update(product_id, None, None)
+
+    def search(self, query, page=1, size=20):
+        # Every word must match; the last one may be a prefix so results follow typing.
+        # Scored by weight * idf. Returns (product ids for the page, total matches,
+        # whether the total is exact rather than "at least", for big result sets).
+        words = tokenize(query)
+        if not words:
+            return [], 0, True
+
+        self.ensure_built()
+        with self._lock:
+            index = self.index
+            others = list(dict.fromkeys(words[:-1]))  # a repeated word counts once
+            if any(word not in index.postings for word in others):
+                return [], 0, True
+            exact = [(index.postings[word], index.levels[word]) for word in others]
+            last = [(index.postings[term], index.levels[term]) for term in index.expand(words[-1])]
+        if not last:
+            return [], 0, True
+
+        start = (page - 1) * size
+        wanted = start + size
+        exact.sort(key=lambda slot: len(slot[0]))  # rarest first
+        if not exact and len(last) == 1:
+            postings, levels = last[0]
+            ids = chain.from_iterable(ids for _, ids in levels)
+            return list(islice(ids, start, wanted)), len(postings), True
+
+        smallest = min(len(exact[0][0]) if exact else SCORE_ALL_BELOW, sum(len(postings) for postings, _ in last))
+        if len(exact) > 1 or smallest < SCORE_ALL_BELOW:
+            ids, totals = _score_all(exact, last)
+            return _page(ids, totals, wanted)[start:], len(ids), True
+
+        slots = [[(score, ids, postings) for score, ids in levels] for postings, levels in exact]
+        slots.append(sorted(((score, ids, postings) for postings, levels in last for score, ids in levels),
+                            key=itemgetter(0), reverse=True))
+        limit = max(MAX_COUNT, wanted + 1)
+        total = _count(exact, last, limit)
+        return _best_first(slots, wanted)[start:], total, total < limit
+
+    def suggest(self, prefix, limit=10):
+        words = tokenize(prefix)
+        if not words:
+            return []
+
+        self.ensure_built()
+        with self._lock:
+            return self.index.expand(words[-1])[:limit]
+
+
+def _intersect(ids, postings):
+    # Walking a dict and probing a small set, which stays in cache, is a few
+    # times cheaper per id than probing a big dict, so walk the dict unless
+    # it's much the bigger
+    return ids.intersection(postings) if len(postings) < 4 * len(ids) else postings.keys() & ids
+
+
+def _score_all(exact, last):
+    # Intersect from the rarest word, so each step probes the fewest ids; the
+    # last word's expansions count as one, from their union. The last word
+    # scores its best expansion, and only where the others matched.
+    matched = None
+    if exact and sum(len(postings) for postings, _ in last) < len(exact[0][0]):
+        matched = set().union(*(postings for postings, _ in last))
+    for postings, _ in exact:
+        matched = set(postings) if matched is None else _intersect(matched, postings)
+    if len(last) == 1:
+        postings = last[0][0]
+        hits = _intersect(matched, postings)
+        best = dict(zip(hits, map(postings.__getitem__, hits)))
+    else:
+        best = {}
+        for score, ids in sorted(chain.from_iterable(levels for _, levels in last), key=itemgetter(0)):
+            # Worst score first, so each id ends up with its best expansion's
+            best.update(dict.fromkeys(ids if matched is None else matched.intersection(ids), score))
+    ids = list(best)
+    totals = list(map(best.__getitem__, ids))
+    for postings, _ in exact:
+        totals = list(map(add, totals, map(postings.__getitem__, ids)))
+    return ids, totals
+
+
+def _page(ids, totals, wanted):
+    # The first `wanted` ids, best first, ties by id
+    if not ids:
+        return []
+    floor = nlargest(wanted, totals)[-1]
+    ranked = sorted(compress(zip(totals, ids), map(floor.__le__, totals)), key=lambda item: (-item[0], item[1]))
+    return [product_id for _, product_id in ranked[:wanted]]
+
+
+def _best_first(slots, wanted):
+    # A slot is a word's (score, ids, postings) groups, best first, so every
+    # product in a combination of one group per word has the same total.
+    # Combinations are visited best first until `wanted` products are found and
+    # what's left scores less than the last of them. A product the last word
+    # reaches through several expansions is kept at the first, best, one.
+    position = (0,) * len(slots)
+    heap = [(-_total(slots, position), position)]
+    queued = {position}
+    found = {}
+    floor = None
+    while heap:
+        negative, position = heappop(heap)
+        if floor is not None and -negative < floor:
+            break
+        groups = sorted((slot[index] for slot, index in zip(slots, position)), key=lambda group: len(group[1]))
+        ids = groups[0][1]
+        for score, _, postings in groups[1:]:
+            ids = [product_id for product_id in ids if postings.get(product_id) == score]
+        for product_id in ids:
+            found.setdefault(product_id, -negative)
+        if floor is None and len(found) >= wanted:
+            floor = -negative
+        for n, slot in enumerate(slots):
+            if position[n] + 1 < len(slot):
+                following = position[:n] + (position[n] + 1,) + position[n + 1:]
+                if following not in queued:
+                    queued.add(following)
+                    heappush(heap, (-_total(slots, following), following))
+
+    # found is in best first order already; only equal totals need ordering by id
+    ranked = []
+    for _, tied in groupby(found.items(), key=itemgetter(1)):
+        ranked.extend(sorted(product_id for product_id, _ in tied))
+        if len(ranked) >= wanted:
+            break
+    return ranked[:wanted]
+
+
+def _total(slots, position):
+    return sum(slot[index][0] for slot, index in zip(slots, position))
+
+
+def _count(exact, last, limit):
+    # Products matching the other word (there is at most one here) and any
+    # expansion of the last, counted up to `limit`: each expansion is walked
+    # from whichever side is smaller, a chunk at a time
+    other = exact[0][0] if exact else None
+    counted = set()
+    for postings in sorted((postings for postings, _ in last), key=len, reverse=True):
+        small, large = (postings, other) if other is None or len(postings) <= len(other) else (other, postings)
+        ids = iter(small)
+        while chunk := set(islice(ids, limit)):
+            counted |= chunk if other is None else large.keys() & chunk
+            if len(counted) >= limit:
+                return limit
+    return len(counted)
+
+
+search_index = SearchIndex()
+
+
+# Keep the index in step with admin edits made in this process: changed products
+# are re-indexed after commit, bulk statements (imports, Query.update()/delete())
+# just mark it stale. Stock decrements at checkout don't change anything searchable.
+
+@changes.subscribe(Product, columns=('product_name', 'description'))
+def _apply_changes(rows, bulk):
+    if bulk:
+        search_index.stale = True
+    for product_id, values in rows.items():
+        if values is None:
+            search_index.remove(product_id)
+        else:
+            search_index.update(product_id, values['product_name'], values['description'])
@@ -1,50 +1,89 @@
-$('.plus-cart').click(function(){
-    console.log('Button clicked')
+// +/- clicks are collected per cart line and sent as one PATCH once the
+// clicking stops; the page then shows what the server actually stored.
+// Clicks still pending when the page is left are sent before it goes.
+var pendingDeltas = {}
+var flushTimer = null
 
-    var id = $(this).attr('pid').toString()
-    var quantity = this.parentNode.children[2]
+function queueDelta(button, delta){
+    var id = $(button).attr('pid').toString()
+    var quantity = button.parentNode.children[2]
+    var current = parseInt(quantity.innerText)
+    var shown = Math.max(current + delta, 1)
+    if (shown === current) {
+        return  // already at 1; removing the line is the Remove button's job
+    }
+
+    quantity.innerText = shown
+    document.getElementById(`quantity${id}`).innerText = shown
+    pendingDeltas[id] = (pendingDeltas[id] || 0) + shown - current
+
+    clearTimeout(flushTimer)
+    flushTimer = setTimeout(flushDeltas, 400)
+}
+
+function flushDeltas(){
+    var deltas = pendingDeltas
+    pendingDeltas = {}
 
     $.ajax({
-        type: 'GET',
-        url: '/pluscart',
-        data: {
-            cart_id: id
-        },
-        
+        type: 'PATCH',
+        url: '/api/cart',
+        contentType: 'application/json',
+        data: JSON.stringify({deltas: deltas}),
+
         success: function(data){
-            console.log(data)
-            quantity.innerText = data.quantity
-            document.getElementById(`quantity${id}`).innerText = data.quantity
+            data.lines.forEach(function(line){
+                var button = document.querySelector(`.plus-cart[pid="${line.id}"]`)
+                if (button) {
+                    button.parentNode.children[2].innerText = line.quantity
+                }
+                document.getElementById(`quantity${line.id}`).innerText = line.quantity
+            })
             document.getElementById('amount_tt').innerText = data.amount
             document.getElementById('totalamount').innerText = data.total
-
         }
     })
-})
+}
 
+function sendPendingDeltas(){
+    // Outlives the page, unlike jQuery's request, which is cancelled with it
+    clearTimeout(flushTimer)
+    var deltas = pendingDeltas
+    pendingDeltas = {}
 
-$('.minus-cart').click(function(){
-    console.log('Button clicked')
+    return fetch('/api/cart', {
+        method: 'PATCH',
+        keepalive: true,
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({deltas: deltas})
+    })
+}
 
-    var id = $(this).attr('pid').toString()
-    var quantity = this.parentNode.children[2]
+$('#checkout-form').on('submit', function(event){
+    if ($.isEmptyObject(pendingDeltas)) {
+        return
+    }
+    // Checkout reads the cart from the database, so the clicks must land first
+    event.preventDefault()
+    var form = this
+    sendPendingDeltas().finally(function(){
+        form.submit()
+    })
+})
 
-    $.ajax({
-        type: 'GET',
-        url: '/minuscart',
-        data: {
-            cart_id: id
-        },
-        
-        success: function(data){
-            console.log(data)
-            quantity.innerText = data.quantity
-            document.getElementById(`quantity${id}`).innerText = data.quantity
-            document.getElementById('amount_tt').innerText = data.amount
-            document.getElementById('totalamount').innerText = data.total
+window.addEventListener('pagehide', function(){
+    if (!$.isEmptyObject(pendingDeltas)) {
+        sendPendingDeltas()
+    }
+})
 
-        }
-    })
+$('.plus-cart').click(function(){
+    queueDelta(this, 1)
+})
+
+
+$('.minus-cart').click(function(){
+    queueDelta(this, -1)
 })
 
 
@@ -66,4 +105,25 @@ $('.remove-cart').click(function(){
 
 
 
-})
\ No newline at end of file
+})
+
+$('input[name="q"]').on('input', function(){
+
+    var list = document.getElementById('search-suggestions')
+
+    $.ajax({
+    type: 'GET',
+    url: '/search/suggest',
+    data: {
+        q: this.value
+    },
+    success: function(data){
+        list.innerHTML = ''
+        data.forEach(function(term){
+            var option = document.createElement('option')
+            option.value = term
+            list.appendChild(option)
+        })
+    }
+    })
+})
@@ -1,8 +1,19 @@
 from flask import Blueprint, render_template, flash, redirect, request, jsonify, url_for, current_app
-from .models import Product, Cart, Order
-import stripe
+from .models import Product, Cart
 from flask_login import login_required, current_user
 from .init import db
+from .queries import cart_items, customer_orders, order_page, PAGE_SIZE
+from .pricing import cart_totals
+from .catalog import flash_sale_items
+from .carts import add_item, change_quantity, apply_deltas, MAX_BATCH, MAX_DELTA
+from .checkout import OutOfStock, save_checkout
+from .payments import gateway
+from .jobs import enqueue
+from .search import search_index
+from .replicas import read_replica
+from .fragments import conditional
+from .money import format_cents
+from .ratelimit import rate_limit, by_user
 
 
 
@@ -12,46 +23,53 @@ views = Blueprint("views",__name__)
 
 @views.route('/')
 @views.route('/home')
+@read_replica
+@conditional
 def home():
-    items= Product.query.filter_by(flash_sale=True)      
+    items= flash_sale_items()      
     return render_template('home.html', items=items, cart= Cart.query.filter_by(customer_link=current_user.id).all() 
                            if current_user.is_authenticated else [])  # Pass cart items if user is authenticated
 
 
-@views.route('/add-to-cart/<int:id>')
-@login_required
-def add_to_cart(id):
+@views.route('/search', methods=['GET', 'POST'])
+def search():
+    query = request.values.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    size = 20
 
-    item_to_add = Product.query.get_or_404(id)
+    ids, total, exact = search_index.search(query, page, size)
+    products = {p.id: p for p in Product.query.filter(Product.id.in_(ids))} if ids else {}
+    items = [products[i] for i in ids if i in products]  # keep the ranking order
 
+    return render_template('search.html', items=items, query=query, page=page, total=total, exact=exact,
+                           has_next=page * size < total,
+                           cart= Cart.query.filter_by(customer_link=current_user.id).all() 
+                           if current_user.is_authenticated else [])
 
-    item_exists = Cart.query.filter_by(product_link=id, customer_link=current_user.id).first()
 
-    if item_exists:
-        try:
-            item_exists.quantity += 1
-            db.session.commit()
+@views.route('/search/suggest')
+def search_suggest():
+    return jsonify(search_index.suggest(request.args.get('q', '')))
 
-            flash('Item quantity updated in cart.', 'success')
-        except Exception as e:
-            print(e)
-            db.session.rollback()
-            flash('Failed to update item in cart.', 'danger')
 
-    else:
-        new_cart_item = Cart()                 
-        new_cart_item.quantity = 1   
-        new_cart_item.product_link = item_to_add.id  
-        new_cart_item.customer_link = current_user.id 
+@views.route('/add-to-cart/<int:id>')
+@login_required
+@rate_limit('cart-user', 60, 60, key=by_user)
+@rate_limit('cart-ip', 120, 60)
+def add_to_cart(id):
 
-        try:
-            db.session.add(new_cart_item)
-            db.session.commit()
+    item_to_add = Product.query.get_or_404(id)
+
+    try:
+        quantity = add_item(current_user.id, item_to_add.id)
+        if quantity > 1:
+            flash('Item quantity updated in cart.', 'success')
+        else:
             flash('Item added to cart.', 'success')
-        except Exception as e:
-            print('Error adding item to cart:', e)
-            db.session.rollback()
-            flash('Failed to add item to cart.', 'danger')
+    except Exception as e:
+        print('Error adding item to cart:', e)
+        db.session.rollback()
+        flash('Failed to add item to cart.', 'danger')
 
     return redirect('/')
 
@@ -59,82 +77,89 @@ def add_to_cart(id):
 @views.route('/cart')
 @login_required
 def cart():
-    cart = Cart.query.filter_by(customer_link=current_user.id).all()
-    
-    amount = 0
-    for item in cart:
+    cart = cart_items(current_user.id)
+    totals = cart_totals(current_user.id)
 
-        amount += item.product.current_price * item.quantity
-    return render_template('cart.html', cart=cart, amount=amount, total=amount + 100)
+    return render_template('cart.html', cart=cart, amount=totals['amount'], total=totals['total'])
 
 @views.route('/pluscart')
 @login_required
+@rate_limit('cart-user', 60, 60, key=by_user)
+@rate_limit('cart-ip', 120, 60)
 def plus_cart():
     if request.method == 'GET':
-        cart_id = request.args.get('cart_id')
-        cart_item = Cart.query.get(cart_id)
-        cart_item.quantity = cart_item.quantity + 1
-        db.session.commit()
-
-        cart = Cart.query.filter_by(product_link=current_user.id).all()
-
-        amount = 0
-        for item in cart:
-            amount+= item.product.current_price * item.quantity
+        cart_id = request.args.get('cart_id', type=int)
+        quantity = change_quantity(current_user.id, cart_id, 1)
+        if quantity is None:
+            return jsonify({'error': 'Cart item not found.'}), 404
 
-        data = {
-            'quantity': cart_item.quantity,
-            'amount': amount,
-            'total': amount + 200
-        }
+        data = cart_totals(current_user.id)
+        data['quantity'] = quantity
 
         return jsonify(data)
     
 
 @views.route('/minuscart')
 @login_required
+@rate_limit('cart-user', 60, 60, key=by_user)
+@rate_limit('cart-ip', 120, 60)
 def minus_cart():
     if request.method == 'GET':
-        cart_id = request.args.get('cart_id')
-        cart_item = Cart.query.get(cart_id)
-        cart_item.quantity = cart_item.quantity - 1
-        db.session.commit()
+        cart_id = request.args.get('cart_id', type=int)
+        quantity = change_quantity(current_user.id, cart_id, -1)
+        if quantity is None:
+            return jsonify({'error': 'Cart item not found.'}), 404
 
-        cart = Cart.query.filter_by(product_link=current_user.id).all()
+        data = cart_totals(current_user.id)
+        data['quantity'] = quantity
 
-        amount = 0
-        for item in cart:
-            amount+= item.product.current_price * item.quantity
+        return jsonify(data)
 
-        data = {
-            'quantity': cart_item.quantity,
-            'amount': amount,
-            'total': amount + 200
-        }
+def cart_json(customer_id):
+    lines = [{'id': item.id, 'product_id': item.product_link, 'product_name': item.product.product_name,
+              'price_cents': item.product.current_price_cents, 'price': format_cents(item.product.current_price_cents),
+              'quantity': item.quantity}
+             for item in cart_items(customer_id)]
+    return dict(cart_totals(customer_id), lines=lines)
+
+
+@views.route('/api/cart', methods=['GET', 'PATCH'])
+@login_required
+@rate_limit('cart-user', 60, 60, key=by_user, methods=('PATCH',))
+@rate_limit('cart-ip', 120, 60, methods=('PATCH',))
+def cart_api():
+    # PATCH {"deltas": {"<cart_id>": <change>, ...}} applies a batch of quantity
+    # changes in one transaction and returns the recomputed cart.
+    if request.method == 'PATCH':
+        deltas = (request.get_json(silent=True) or {}).get('deltas')
+        try:
+            deltas = {int(cart_id): int(delta) for cart_id, delta in deltas.items()}
+        except (AttributeError, TypeError, ValueError, OverflowError):
+            return jsonify({'error': 'Expected {"deltas": {"<cart_id>": <integer>}}.'}), 400
+        if len(deltas) > MAX_BATCH:
+            return jsonify({'error': f'At most {MAX_BATCH} lines per request.'}), 400
+        if any(abs(delta) > MAX_DELTA for delta in deltas.values()):
+            return jsonify({'error': f'A quantity can change by at most {MAX_DELTA} per request.'}), 400
+
+        missing = apply_deltas(current_user.id, {k: v for k, v in deltas.items() if v})
+        return jsonify(dict(cart_json(current_user.id), missing=missing))
+
+    return jsonify(cart_json(current_user.id))
 
-        return jsonify(data)
 
 @views.route('/removecart/<int:id>')
 @login_required
 def remove_item(id):
 
+        quantity = 0
         cart_item = Cart.query.get(id)
         if cart_item and cart_item.customer_link == current_user.id:  
             quantity = cart_item.quantity    
             db.session.delete(cart_item)
             db.session.commit()
 
-        cart = Cart.query.filter_by(customer_link=current_user.id).all()
-
-        amount = 0
-        for item in cart:
-            amount+= item.product.current_price * item.quantity
-
-        data = {
-            'quantity': quantity,
-            'amount': amount,
-            'total': amount + 200
-        }
+        data = cart_totals(current_user.id)
+        data['quantity'] = quantity
 
         return jsonify(data)
 
@@ -145,40 +170,40 @@ def remove_item(id):
 def create_checkout_session():
     try:
 
-        cart_items = Cart.query.filter_by(customer_link=current_user.id).all()
+        items = cart_items(current_user.id)
         
-        if not cart_items:
+        if not items:
             flash('Your cart is empty!', 'warning')
             return redirect(url_for('views.cart'))
 
 
         line_items = []
-        for cart_item in cart_items:
-            product = Product.query.get(cart_item.product_link)  # <-- fetch product
+        for cart_item in items:
+            product = cart_item.product  # <-- loaded with the cart rows
             if not product:
                 flash('One of your products no longer exists.', 'danger')
                 return redirect(url_for('views.cart'))
 
             line_items.append({
                 "price_data": {
-                    "currency": "usd",  
+                    "currency": product.currency,  
                     "product_data": {
                         "name": product.product_name,
                         "description": product.description or "NO Description Available",
                     },
-                    "unit_amount": int(product.current_price *100), 
+                    "unit_amount": product.current_price_cents,  # already minor units
                 },
                 "quantity": cart_item.quantity,
             })
 
         # Create Stripe checkout session
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=['card'], 
-            line_items=line_items,
-            mode='payment',
+        checkout_session = gateway.create_checkout_session(
+            line_items,
             success_url=url_for('views.payment_success', _external=True) + '?session_id={CHECKOUT_SESSION_ID}',
             cancel_url=url_for('views.cart', _external=True),
+            customer_id=current_user.id,
         )
+        save_checkout(current_user.id, checkout_session.id, items)  # what this session charges for
 
         return redirect(checkout_session.url, code=303)
 
@@ -190,37 +215,50 @@ def create_checkout_session():
 @views.route("/payment-success")
 @login_required
 def payment_success():
-    session_id = request.args.get("id")
-    if session_id:
-        session = stripe.checkout.Session.retrieve(id)
-        payment_intent = stripe.PaymentIntent.retrieve(session.payment_intent)
-
-
-        cart_items = Cart.query.filter_by(customer_link=current_user.id).all()
-        for cart_item in cart_items:
-            order = Order(
-                price=cart_item.product.current_price * cart_item.quantity,
-                payment_id=payment_intent.id,
-                quantity=cart_item.quantity,
-                status="Paid",
-                customer_link=current_user.id,
-                product_link=cart_item.product.id,          
-            )
-            db.session.add(order)
-
-        product = Cart.query.filter_by(customer_link=current_user.id).all()
-        for item in product:
-            db.session.delete(item)
-        
-        db.session.commit()
+    session_id = request.args.get("session_id")
+    if session_id and current_app.config.get('STRIPE_WEBHOOK_SECRET'):
+        # Orders are created by the webhook job, nothing to wait for here
+        flash("Payment received! Your order is being confirmed.", "success")
 
-        flash("Payment successful! Your order has been placed.", "success")
+    elif session_id and gateway.executor:
+        gateway.submit_confirmation(session_id, current_user.id)
+        flash("Payment received! Your order is being confirmed.", "success")
+
+    elif session_id:
+        try:
+            if gateway.confirm_and_finalize(session_id, current_user.id):
+                flash("Payment successful! Your order has been placed.", "success")
+        except OutOfStock as e:
+            print(e)
+            flash('Some items sold out before your order was placed. Your payment has been refunded.', 'danger')
+            return redirect(url_for('views.cart'))
 
     return render_template("success.html")
 
+@views.route('/stripe/webhook', methods=['POST'])
+def stripe_webhook():
+    try:
+        event = gateway.parse_webhook(request.get_data(), request.headers.get('Stripe-Signature'))
+    except Exception as e:
+        print(e)
+        return jsonify({'error': 'Invalid webhook.'}), 400
+
+    if event['type'] == 'checkout.session.completed':
+        session = event['data']['object']
+        if session['payment_status'] == 'paid' and session['client_reference_id']:
+            enqueue('confirm_checkout', {
+                'customer_id': int(session['client_reference_id']),
+                'payment_id': session['payment_intent'],
+                'session_id': session['id'],
+            })
+
+    return jsonify({'received': True})
+
 @views.route('/orders')
 @login_required
+@read_replica
 def orders():
-    user_orders = Order.query.filter_by(customer_link=current_user.id).all()
+    after = request.args.get('after', 0, type=int)
+    user_orders, next_cursor = order_page(customer_orders(current_user.id), after, PAGE_SIZE)
 
-    return render_template('orders.html', orders=user_orders)
+    return render_template('orders.html', orders=user_orders, next_cursor=next_cursor)
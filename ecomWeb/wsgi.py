@@ -0,0 +1,5 @@
+from project3.init import create_app
+
+
+# Production entry point: gunicorn -c gunicorn.conf.py (main.py is the dev server)
+app = create_app()